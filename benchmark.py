@@ -0,0 +1,345 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from array import array
+from time import perf_counter_ns
+
+# Run without a display or sound card
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from constants import *
+from big_number import BigNumber
+from engine import GameState, PRICE_SCHEDULES
+import main as game
+
+
+'''
+This is a file containing the frame time benchmarks, which run the real game loops headless.
+Each scenario starts the title screen or the game from a fixed state, posts the same mouse events
+before every frame, and runs uncapped for a number of frames, timing each one.
+
+Every scenario runs in a process of its own, so the caches of one scenario do not speed up the next.
+The allocations are measured with tracemalloc in a second run, because tracing slows every frame down.
+
+Usage:
+    python benchmark.py                                # Run every scenario
+    python benchmark.py --output results.json          # Save the results
+    python benchmark.py --baseline results.json        # Compare against saved results
+    python benchmark.py --ticks                        # Time a tick of the economy instead
+'''
+
+
+# ----------------- Game States -----------------
+# A game that has just started
+def create_new_state():
+    return GameState()
+
+
+# A game far enough along that every item and upgrade is shown
+def create_late_state():
+    state = GameState()
+    state.item_counts = [25] * NUM_ITEMS
+    state.item_prices = [PRICE_SCHEDULES[item_type].price(25) for item_type in range(NUM_ITEMS)]
+    state.recalculate_rates()
+
+    state.money = BigNumber(UPGRADE_ORDER_COSTS[-1] * 10)
+    state.pollution_cleared = BigNumber(1e12)
+    state.total_pollution_cleared = BigNumber(1e19)
+    state.update_upgrades()
+
+    return state
+
+
+# ----------------- Mouse Events -----------------
+# Each of these returns the events to post before the frame after the given one
+
+def no_events(frame):
+    return []
+
+
+def move_mouse(pos):
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0))
+
+
+def press_mouse(pos):
+    return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1)
+
+
+def release_mouse(pos):
+    return pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1)
+
+
+# Rest the mouse on the third item, moving it by a pixel every frame like a real hand
+def hover_item_events(frame):
+    return [move_mouse((LAYER_RIGHT_RECT[0] + 195 + frame % 2, LAYER_ITEMS_RECT[3] + 250))]
+
+
+# Click the middle of the earth every frame. The game ignores clicks that come too quickly
+def clicking_events(frame):
+    pos = pygame.Rect(EARTH_CLICKER_RECT).center
+    return [move_mouse(pos), press_mouse(pos), release_mouse(pos)]
+
+
+# Grab the scroll bar, then drag it from the top to the bottom and back again, over and over
+SCROLL_STEP = 5
+SCROLL_RANGE = NUM_ITEMS * 100 - 600
+
+
+def scroll_events(frame):
+    x = LAYER_RIGHT_RECT[0] + 395
+    top = LAYER_RIGHT_RECT[1] + LAYER_ITEMS_RECT[3] + 25
+
+    if frame == 0:
+        return [move_mouse((x, top))]
+    if frame == 1:
+        return [press_mouse((x, top))]
+
+    # A triangle wave between the top and the bottom
+    distance = (frame * SCROLL_STEP) % (2 * SCROLL_RANGE)
+    return [move_mouse((x, top + min(distance, 2 * SCROLL_RANGE - distance)))]
+
+
+# ----------------- Scenarios -----------------
+# The state each scenario starts from, or None for the title screen, and its mouse events
+SCENARIOS = {
+    "title": (None, no_events),
+    "idle": (create_new_state, no_events),
+    "all_items": (create_late_state, no_events),
+    "item_popup": (create_late_state, hover_item_events),
+    "clicking": (create_new_state, clicking_events),
+    "scroll": (create_late_state, scroll_events),
+}
+
+
+# Called by the game at the end of every frame. It times the frame, posts the events for the next one,
+# and quits once enough frames have been measured
+class FrameRecorder:
+    def __init__(self, get_events, frames, warmup, trace_allocations):
+        self.get_events = get_events
+        self.frames = frames
+        self.warmup = warmup
+        self.trace_allocations = trace_allocations
+
+        self.frame = 0
+        self.frame_times = array("q")  # Nanoseconds
+        self.frame_allocations = array("q")  # The most bytes allocated at once during each frame
+
+        self.frame_start = perf_counter_ns()
+        self.frame_start_memory = 0
+        self.start_memory = 0
+        self.end_memory = 0
+
+    def __call__(self):
+        now = perf_counter_ns()
+        measuring = self.frame >= self.warmup
+
+        if measuring:
+            self.frame_times.append(now - self.frame_start)
+
+        if self.trace_allocations:
+            memory, peak = tracemalloc.get_traced_memory()
+            if measuring:
+                self.frame_allocations.append(peak - self.frame_start_memory)
+            if self.frame + 1 == self.warmup:
+                self.start_memory = memory
+            self.end_memory = memory
+
+        self.frame += 1
+        if self.frame >= self.warmup + self.frames:
+            pygame.event.post(pygame.event.Event(pygame.QUIT))
+        else:
+            for event in self.get_events(self.frame - 1):
+                pygame.event.post(event)
+
+        # Recording is left out of the next frame's time
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            self.frame_start_memory = tracemalloc.get_traced_memory()[0]
+        self.frame_start = perf_counter_ns()
+
+
+# Runs one scenario in this process, and returns its frame times and allocations
+def run_scenario(name, frames, warmup, trace_allocations):
+    create_state, get_events = SCENARIOS[name]
+    random.seed(0)
+
+    recorder = FrameRecorder(get_events, frames, warmup, trace_allocations)
+    if trace_allocations:
+        tracemalloc.start()
+        recorder.frame_start_memory = tracemalloc.get_traced_memory()[0]
+
+    if create_state is None:
+        game.main(fps_cap=0, frame_callback=recorder)
+    else:
+        pygame.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+
+        # The game saves when it quits, so it is given a save file of its own
+        with tempfile.TemporaryDirectory() as save_directory:
+            game.main_game(screen, create_state(), os.path.join(save_directory, "benchmark.sav"),
+                           fps_cap=0, frame_callback=recorder)
+
+    if trace_allocations:
+        tracemalloc.stop()
+
+    return recorder
+
+
+# ----------------- Statistics -----------------
+def percentile(ordered, percent):
+    return ordered[(len(ordered) - 1) * percent // 100]
+
+
+def summarize_frame_times(frame_times):
+    ordered = sorted(frame_times)
+    return {
+        "mean_ms": sum(ordered) / len(ordered) / 1e6,
+        "p50_ms": percentile(ordered, 50) / 1e6,
+        "p95_ms": percentile(ordered, 95) / 1e6,
+        "p99_ms": percentile(ordered, 99) / 1e6,
+        "max_ms": ordered[-1] / 1e6,
+    }
+
+
+def summarize_allocations(recorder):
+    ordered = sorted(recorder.frame_allocations)
+    return {
+        "frame_allocated_kib_mean": sum(ordered) / len(ordered) / 1024,
+        "frame_allocated_kib_p99": percentile(ordered, 99) / 1024,
+        "memory_growth_kib": (recorder.end_memory - recorder.start_memory) / 1024,
+    }
+
+
+# ----------------- The Tick Benchmark -----------------
+# Checks that a tick of the economy costs the same however large the numbers get
+def run_tick_benchmark(ticks=100000):
+    for magnitude in (1e3, 1e21, 1e100, 1e300, BigNumber(10 ** 1000), BigNumber(10 ** 100000)):
+        state = GameState()
+        state.item_counts = [10] * NUM_ITEMS
+        state.recalculate_rates()
+        state.money = BigNumber(magnitude)
+        state.pollution_cleared = BigNumber(magnitude)
+        state.total_pollution_cleared = BigNumber(magnitude)
+
+        seconds = timeit.timeit(lambda: state.tick(SIMULATION_STEP), number=ticks)
+        print("{:>12}: {:.2f} us per tick".format(state.money.format(), seconds / ticks * 1e6))
+
+
+# ----------------- Running the Benchmarks -----------------
+# Runs a scenario in a fresh process, and returns what it printed as the last line of its output
+def run_in_process(name, frames, warmup, trace_allocations):
+    command = [sys.executable, os.path.abspath(__file__), "--child", name,
+               "--frames", str(frames), "--warmup", str(warmup)]
+    if trace_allocations:
+        command.append("--trace-allocations")
+
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmarks(scenarios, frames, warmup):
+    results = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "frames": frames,
+        "warmup": warmup,
+        "scenarios": {},
+    }
+
+    for name in scenarios:
+        result = run_in_process(name, frames, warmup, False)
+        result.update(run_in_process(name, frames, warmup, True))
+        results["scenarios"][name] = result
+
+        print("{:>12}: mean {:6.2f} ms  p95 {:6.2f} ms  p99 {:6.2f} ms  {:8.1f} KiB allocated per frame".format(
+            name, result["mean_ms"], result["p95_ms"], result["p99_ms"], result["frame_allocated_kib_mean"]))
+
+    return results
+
+
+# Prints how each scenario changed from the baseline.
+# Returns whether any scenario's p95 frame time got slower by more than threshold percent
+def compare_to_baseline(results, baseline, threshold):
+    regressed = False
+
+    print()
+    print("Compared to the baseline:")
+    for name, result in results["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            print("{:>12}: not in the baseline".format(name))
+            continue
+
+        changes = []
+        for key in ("mean_ms", "p95_ms", "p99_ms", "frame_allocated_kib_mean"):
+            before = baseline["scenarios"][name][key]
+            changes.append((result[key] - before) / before * 100 if before else 0.0)
+
+        slower = changes[1] > threshold
+        regressed = regressed or slower
+        print("{:>12}: mean {:+6.1f}%  p95 {:+6.1f}%  p99 {:+6.1f}%  allocated {:+6.1f}%{}".format(
+            name, *changes, "  SLOWER" if slower else ""))
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the frames of the game in headless scenarios.")
+    parser.add_argument("scenarios", nargs="*", help="the scenarios to run, or all of them: " + ", ".join(SCENARIOS))
+    parser.add_argument("--frames", type=int, default=600, help="frames measured in each scenario")
+    parser.add_argument("--warmup", type=int, default=60, help="frames run before measuring")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results to this JSON file")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="the percent the p95 frame time can get slower by before failing")
+    parser.add_argument("--ticks", action="store_true", help="time a tick of the economy at growing magnitudes")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--trace-allocations", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    for name in args.scenarios + ([args.child] if args.child else []):
+        if name not in SCENARIOS:
+            parser.error("unknown scenario: " + name)
+
+    if args.ticks:
+        run_tick_benchmark()
+        return 0
+
+    # A single scenario, run by the parent process
+    if args.child:
+        recorder = run_scenario(args.child, args.frames, args.warmup, args.trace_allocations)
+        if args.trace_allocations:
+            print(json.dumps(summarize_allocations(recorder)))
+        else:
+            print(json.dumps(summarize_frame_times(recorder.frame_times)))
+        return 0
+
+    results = run_benchmarks(args.scenarios or list(SCENARIOS), args.frames, args.warmup)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+        if compare_to_baseline(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
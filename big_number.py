@@ -0,0 +1,270 @@
+import math
+import numbers
+from constants import *
+
+
+'''
+This is a file containing the number type used for money and pollution cleared.
+Floats run out at about 1e308, and idle games do not stop, so these numbers are kept as
+a float mantissa and an unbounded integer exponent: value = mantissa * 2 ** exponent.
+
+The mantissa is always 0, or between 0.5 and 1 in size, like math.frexp.
+Scaling by a power of two is exact for floats, so while a value fits in a float,
+adding, multiplying and comparing give exactly the same results as plain floats do.
+'''
+
+
+# Stands in for the exponent of infinity, which is larger than that of any real value
+INFINITE_EXPONENT = 2 ** 62
+
+# Exponents past this are too large for a float
+FLOAT_MAX_EXPONENT = 1024
+
+LOG10_2 = math.log10(2)
+
+
+# ----------------- Big Numbers -----------------
+class BigNumber:
+    __slots__ = ("mantissa", "exponent")
+
+    def __init__(self, value=0):
+        if isinstance(value, BigNumber):
+            self.mantissa = value.mantissa
+            self.exponent = value.exponent
+        elif isinstance(value, int) and not -2 ** 1000 < value < 2 ** 1000:
+            # Too big for a float, so only the top bits are kept
+            shift = abs(value).bit_length() - 64
+            mantissa, exponent = math.frexp(float(value >> shift if value > 0 else -(-value >> shift)))
+            self.mantissa = mantissa
+            self.exponent = exponent + shift
+        else:
+            self.set(*math.frexp(value))
+
+    # Build a number straight from a mantissa and exponent, normalizing the mantissa
+    @classmethod
+    def make(cls, mantissa, exponent):
+        number = cls.__new__(cls)
+        mantissa, shift = math.frexp(mantissa)
+        number.set(mantissa, exponent + shift)
+
+        return number
+
+    def set(self, mantissa, exponent):
+        self.mantissa = mantissa
+        if mantissa == 0:
+            self.exponent = 0
+        elif math.isinf(mantissa):
+            self.exponent = INFINITE_EXPONENT
+        else:
+            self.exponent = exponent
+
+    # ----------------- Arithmetic -----------------
+    def __add__(self, other):
+        if not isinstance(other, BigNumber):
+            other = BigNumber(other)
+
+        # Line the smaller number up with the larger one. Anything too small to matter shifts to 0
+        if self.exponent >= other.exponent:
+            shift = max(-2000, other.exponent - self.exponent)
+            return BigNumber.make(self.mantissa + math.ldexp(other.mantissa, shift), self.exponent)
+
+        shift = max(-2000, self.exponent - other.exponent)
+        return BigNumber.make(other.mantissa + math.ldexp(self.mantissa, shift), other.exponent)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        number = BigNumber.__new__(BigNumber)
+        number.mantissa = -self.mantissa
+        number.exponent = self.exponent
+
+        return number
+
+    def __abs__(self):
+        return -self if self.mantissa < 0 else self
+
+    def __sub__(self, other):
+        if not isinstance(other, BigNumber):
+            other = BigNumber(other)
+
+        return self + -other
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __mul__(self, other):
+        if not isinstance(other, BigNumber):
+            other = BigNumber(other)
+
+        return BigNumber.make(self.mantissa * other.mantissa, self.exponent + other.exponent)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if not isinstance(other, BigNumber):
+            other = BigNumber(other)
+
+        return BigNumber.make(self.mantissa / other.mantissa, self.exponent - other.exponent)
+
+    def __rtruediv__(self, other):
+        return BigNumber(other) / self
+
+    # Rounding only changes numbers small enough to have digits after the decimal point
+    def __round__(self, ndigits=None):
+        if self.exponent > 53:
+            return self
+
+        return BigNumber(round(float(self), ndigits))
+
+    # ----------------- Comparing -----------------
+    # Returns -1, 0 or 1 for less than, equal to or greater than other
+    def compare(self, other):
+        if not isinstance(other, BigNumber):
+            other = BigNumber(other)
+
+        if self.exponent == other.exponent or self.mantissa == 0 or other.mantissa == 0 or \
+                (self.mantissa > 0) != (other.mantissa > 0):
+            return (self.mantissa > other.mantissa) - (self.mantissa < other.mantissa)
+
+        # Both have the same sign, so the larger exponent is further from 0
+        larger = 1 if self.exponent > other.exponent else -1
+
+        return larger if self.mantissa > 0 else -larger
+
+    # Anything that is not a number is left for Python to compare, so == is False and < raises TypeError
+    def __eq__(self, other):
+        if not is_number(other):
+            return NotImplemented
+        return self.compare(other) == 0
+
+    def __ne__(self, other):
+        if not is_number(other):
+            return NotImplemented
+        return self.compare(other) != 0
+
+    def __lt__(self, other):
+        if not is_number(other):
+            return NotImplemented
+        return self.compare(other) < 0
+
+    def __le__(self, other):
+        if not is_number(other):
+            return NotImplemented
+        return self.compare(other) <= 0
+
+    def __gt__(self, other):
+        if not is_number(other):
+            return NotImplemented
+        return self.compare(other) > 0
+
+    def __ge__(self, other):
+        if not is_number(other):
+            return NotImplemented
+        return self.compare(other) >= 0
+
+    __hash__ = None
+
+    def __bool__(self):
+        return self.mantissa != 0
+
+    # ----------------- Converting -----------------
+    def __float__(self):
+        if self.exponent > FLOAT_MAX_EXPONENT:
+            return math.copysign(math.inf, self.mantissa)
+
+        return math.ldexp(self.mantissa, self.exponent)
+
+    def __int__(self):
+        if self.exponent <= 53:
+            return int(float(self))
+
+        return int(math.ldexp(self.mantissa, 53)) << (self.exponent - 53)
+
+    # The base 10 logarithm of the size of the number
+    def log10(self):
+        if self.mantissa == 0:
+            return -math.inf
+
+        # Going through a float keeps powers of ten exact
+        if self.exponent <= FLOAT_MAX_EXPONENT:
+            return math.log10(abs(float(self)))
+
+        return math.log10(abs(self.mantissa)) + self.exponent * LOG10_2
+
+    # The number of digits before the decimal point
+    def digits(self):
+        if abs(self) < 1:
+            return 1
+
+        return int(self.log10()) + 1
+
+    # ----------------- Formatting -----------------
+    # The number with one decimal place and a suffix for every power of a thousand, like 12.3K
+    def format(self, decimals=1):
+        if self.mantissa < 0:
+            return "-" + (-self).format(decimals)
+        if self.exponent == INFINITE_EXPONENT:
+            return "Infinity"
+
+        power = get_power(self)
+        return format_scaled(round(float(self / get_scale(power)), decimals), power, decimals)
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        if self.mantissa == 0 or self.exponent <= FLOAT_MAX_EXPONENT:
+            return "BigNumber({!r})".format(float(self))
+
+        log = self.log10()
+        power = math.floor(log)
+        return "BigNumber({}{:.15g}e{})".format("-" if self.mantissa < 0 else "", 10 ** (log - power), power)
+
+
+# Whether a value can be compared with a BigNumber. The common types are checked first, since it is quicker
+def is_number(value):
+    return isinstance(value, (BigNumber, int, float)) or isinstance(value, numbers.Real)
+
+
+# ----------------- Suffixes and Scales -----------------
+# After the named suffixes in NUMBER_SUFFIX come two letter suffixes: aa, ab, ... zz.
+# Numbers too large even for those are written in scientific notation, like e2100
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+SUFFIXES = NUMBER_SUFFIX + [first + second for first in LETTERS for second in LETTERS]
+
+
+def get_suffix(power):
+    if power < len(SUFFIXES):
+        return SUFFIXES[power]
+
+    return "e" + str(power * 3)
+
+
+# The text of a number that was divided by 1000 ** power and rounded, like 12.3K.
+# Rounding up to the next thousand moves to the next suffix
+def format_scaled(shown, power, decimals=1):
+    if shown >= 1000:
+        power += 1
+        shown = round(shown / 1000, decimals)
+
+    return str(shown) + get_suffix(power)
+
+
+# The power of a thousand that a number is shown with, like 2 for 12.3M
+def get_power(number):
+    if number.mantissa == 0:
+        return 0
+
+    return max(0, int(number.log10() // 3))
+
+
+# 1000 ** power as a BigNumber, worked out once for each power
+SCALES = {}
+
+
+def get_scale(power):
+    if power not in SCALES:
+        SCALES[power] = BigNumber(1000 ** power)
+
+    return SCALES[power]
+
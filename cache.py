@@ -0,0 +1,47 @@
+from collections import OrderedDict
+
+
+'''
+This is a file containing the least recently used cache that the text, text layout and earth frame caches are built on.
+'''
+
+
+# ----------------- The LRU Cache -----------------
+# Remembers values by key, and throws away the least recently used ones once it is full.
+# The hits and misses are counted to check how well it works
+class LRUCache:
+    # Stands in for a missing value, since None can be a real one
+    MISSING = object()
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.items = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the value kept for key, or creates it with create(*args) and keeps it
+    def get(self, key, create, *args):
+        value = self.items.get(key, self.MISSING)
+        if value is not self.MISSING:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return value
+
+        self.misses += 1
+        value = create(*args)
+
+        self.items[key] = value
+        if len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+        return value
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def clear(self):
+        self.items.clear()
@@ -16,6 +16,9 @@ HEIGHT = 700
 
 SCREEN_SIZE = (WIDTH, HEIGHT)
 
+# Fonts
+FONT_FILE = base_path + "fonts/HackbotFreeTrial-8MgA2.otf"
+
 # Colors
 GOLD_COLOR = (255, 206, 46)
 MONEY_COLOR = (101, 214, 131)
@@ -24,6 +27,40 @@ SCREEN_COLOR = (2, 7, 23)
 
 NUM_STARS = 60
 
+# Only update the parts of the display that changed each frame, instead of the whole window
+DIRTY_RECT_RENDERING = False
+
+# Collect the blits of each layer and hand them to pygame all at once, instead of one blit call at a time.
+# Turn this off to compare the two
+BATCHED_BLITTING = True
+
+# Timing
+# The most frames drawn per second. 0 draws as many frames as possible
+FPS_CAP = 60
+
+# The economy is simulated in fixed steps of this many seconds, no matter how fast the frames are drawn
+SIMULATION_STEP = 1 / 60
+
+# Frames longer than this many seconds are cut short, so a slow frame cannot make the simulation fall behind
+MAX_FRAME_TIME = 0.25
+
+# Animations were made for 60 frames per second, and are scaled by how long each frame actually takes
+ANIMATION_FRAME_TIME = 1 / 60
+
+# The most click animations on the screen at once. Clicking faster reuses the oldest ones
+CLICK_PARTICLE_CAPACITY = 32
+
+# Profiling
+# Press F3 in the game to show how long each part of a frame takes.
+# Set this to a file name to also write how long every part of every frame took to a CSV file
+PROFILER_CSV_FILE = None
+
+# Saving
+SAVE_FILE = base_path + "carbon_clicker.sav"
+
+# Seconds between autosaves
+AUTOSAVE_INTERVAL = 30
+
 # Main Layer component information
 LAYER_LEFT_RECT = (0, 0, 300, HEIGHT)
 LAYER_MIDDLE_RECT = (LAYER_LEFT_RECT[2], 0, 400, HEIGHT)
@@ -52,6 +89,8 @@ LAYER_BOTTOM_RECT = (LAYER_MIDDLE_RECT[0], 180, LAYER_MIDDLE_RECT[2], HEIGHT - 1
 
 SELL_BUTTON_RECT = (LAYER_MIDDLE_RECT[0] + LAYER_MIDDLE_RECT[2] // 2 - 150 // 2, 600, 150, 70)
 
+BUY_AMOUNT_BUTTON_RECT = (LAYER_ITEMS_RECT[0] + LAYER_ITEMS_RECT[2] - 115, LAYER_ITEMS_RECT[1] + 30, 70, 40)
+
 LAYER_ACHIEVEMENT_TITLE_RECT = (0, 0, 300, 100)
 LAYER_UPGRADE_TITLE_RECT = (0, LAYER_ACHIEVEMENT_TITLE_RECT[3] + 150, 300, 100)
 
@@ -64,7 +103,7 @@ EARTH_CLICKER_LARGE_RECT = (LAYER_MIDDLE_RECT[0]+45, LAYER_MIDDLE_RECT[1]+265,
                       310, 310)
 
 # Suffixes for numbers for scaling
-NUMBER_SUFFIX = [" ", "K", "M", "B", "T", "Qa", "Qu", "Sx"]
+NUMBER_SUFFIX = [" ", "K", "M", "B", "T", "Qa", "Qu", "Sx", "Sp", "Oc", "No", "Dc"]
 
 # Item information indexed by item type
 # Position in array corresponds to type of item
@@ -74,6 +113,10 @@ ITEM_NAMES = ["Volunteer", "Claw", "Tree", "Seabin", "River Trash Fence", "Recyc
 ITEM_PRICES = [10, 100, 1000, 10000, 100000, 800000, 6000000, 40000000, 300000000]
 ITEM_RATES = [0.5, 6, 70, 800, 10000, 100000, 900000, 6300000, 56000000]
 
+# How many items are bought with each click. The button cycles through them
+BUY_MAX = "max"
+BUY_AMOUNTS = [1, 10, 100, BUY_MAX]
+
 # The descriptions for the tower popups
 ITEM_INFO = [
     "The Volunteer: by themselves they may be small, but they are the most important in contributing to the"
@@ -201,3 +244,9 @@ for i_upgrade in range(len(UPGRADE_COSTS)):
         UPGRADE_ORDER.append([i_upgrade, j_upgrade])
 
 UPGRADE_ORDER = sorted(UPGRADE_ORDER, key=lambda x: UPGRADE_COSTS[x[0]][x[1]])
+
+# The position of each upgrade in UPGRADE_ORDER, keyed by (item type, tier)
+UPGRADE_ORDER_INDEX = {(upgrade[0], upgrade[1]): order for order, upgrade in enumerate(UPGRADE_ORDER)}
+
+# The cost of each upgrade in UPGRADE_ORDER. These are sorted, so they can be searched with bisect
+UPGRADE_ORDER_COSTS = [UPGRADE_COSTS[upgrade[0]][upgrade[1]] for upgrade in UPGRADE_ORDER]
@@ -0,0 +1,302 @@
+import math
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from constants import *
+from big_number import BigNumber
+
+
+'''
+This is a file containing the economy of the game, without any of the GUI.
+It does not use pygame, so the game can be simulated much faster than real time for testing and balancing.
+The GUI in main.py is a view over the GameState.
+'''
+
+
+# ----------------- Item Prices -----------------
+# Every purchase makes an item's price round(price * 1.1).
+# While prices are small, the rounding changes them, so those prices are worked out once and kept in a table
+# along with their running totals. Once prices reach 2 ** 53, the rounding stops mattering,
+# and the rest of the prices are a geometric series that can be summed directly.
+# This makes the cost of buying any amount, and the most that can be afforded, quick to find for any count.
+class PriceSchedule:
+    GROWTH = 1.1
+
+    def __init__(self, base_price):
+        self.prices = []
+        self.totals = [0]  # totals[k] is the cost of the first k purchases
+
+        price = base_price
+        while price < 2 ** 53:
+            self.prices.append(price)
+            self.totals.append(self.totals[-1] + price)
+            price = round(price * self.GROWTH)
+
+        # The first price of the geometric series
+        self.series_start = len(self.prices)
+        self.series_price = price
+
+        # The last count whose total still fits in a float
+        self.series_end = self.series_start + int(math.log(sys.float_info.max * (self.GROWTH - 1) / price, self.GROWTH))
+        while math.isinf(self.total(self.series_end)):
+            self.series_end -= 1
+
+    # The price of the next item after count have been bought
+    def price(self, count):
+        if count < self.series_start:
+            return self.prices[count]
+
+        price = self.grow(self.series_price, count - self.series_start)
+
+        return round(price) if price != math.inf else price
+
+    # The cost of the first count purchases
+    def total(self, count):
+        if count <= self.series_start:
+            return self.totals[count]
+
+        steps = count - self.series_start
+        total = self.totals[-1] + self.series_price * (self.grow(1, steps) - 1) / (self.GROWTH - 1)
+
+        return round(total) if total != math.inf else total
+
+    # The cost of buying amount more items after count have been bought.
+    # Past series_end the totals are infinite, and so is the cost
+    def cost(self, count, amount):
+        end_total = self.total(count + amount)
+        if end_total == math.inf:
+            return math.inf
+
+        return end_total - self.total(count)
+
+    # The most items that can be bought with money after count have been bought.
+    # Money can be a BigNumber larger than any float, so the series is inverted with logarithms
+    def max_affordable(self, count, money):
+        if count >= self.series_end:
+            return 0
+
+        budget = self.total(count) + money
+        if budget < self.totals[-1]:
+            return bisect_right(self.totals, budget) - 1 - count
+
+        # Invert the geometric series, and then correct for any floating point error
+        remaining = BigNumber(budget - self.totals[-1])
+        log = (remaining * (self.GROWTH - 1) / self.series_price + 1).log10()
+        if math.isinf(log):
+            affordable = self.series_end
+        else:
+            affordable = min(self.series_start + int(log / math.log10(self.GROWTH)), self.series_end)
+        while affordable < self.series_end and self.total(affordable + 1) <= budget:
+            affordable += 1
+        while affordable > count and self.total(affordable) > budget:
+            affordable -= 1
+
+        return affordable - count
+
+    def grow(self, value, steps):
+        try:
+            return value * self.GROWTH ** steps
+        except OverflowError:
+            return math.inf
+
+
+# The price schedule of each item type
+PRICE_SCHEDULES = [PriceSchedule(price) for price in ITEM_PRICES]
+
+
+# ----------------- The Game State -----------------
+# Owns the money, the pollution cleared, and everything that has been bought
+class GameState:
+    def __init__(self):
+        # These grow without limit, so they are BigNumbers instead of floats
+        self.money = BigNumber()
+
+        self.pollution_cleared = BigNumber()
+        self.total_pollution_cleared = BigNumber()
+        self.previous_pollution_cleared = BigNumber()
+        self.pps = BigNumber()
+        self.pps_time = 0  # Seconds since the PPS was last calculated
+
+        self.click_strength = 0.2
+
+        # Item information indexed by item type
+        self.item_counts = [0] * NUM_ITEMS
+        self.item_prices = list(ITEM_PRICES)
+        self.item_multipliers = [1] * NUM_ITEMS
+
+        # The pollution cleared per second by each item type, and by all of them together.
+        # These only change when something is bought, so they are updated then instead of every tick
+        self.item_rates = [0] * NUM_ITEMS
+        self.rate = 0
+
+        # Upgrade information indexed by the upgrade's position in UPGRADE_ORDER.
+        # Upgrades up to upgrade_count have been unlocked, and upgrades_shown is the sorted list of the unlocked
+        # upgrades that have not been purchased. upgrades_version goes up whenever upgrades_shown changes
+        self.upgrade_count = 0
+        self.upgrades_shown = [0]
+        self.upgrades_purchased = [False] * len(UPGRADE_ORDER)
+        self.upgrades_version = 0
+
+        # The wall clock time when the game was last running, used for offline progress
+        self.last_active_time = time.time()
+
+    # The pollution cleared per second by all the items together
+    def get_rate(self):
+        return self.rate
+
+    # The pollution cleared per second by each item, and its share of the total, for showing statistics
+    def get_rate_breakdown(self):
+        breakdown = []
+        for item_type in range(NUM_ITEMS):
+            share = self.item_rates[item_type] / self.rate if self.rate > 0 else 0
+            breakdown.append((ITEM_NAMES[item_type], self.item_rates[item_type], share))
+
+        return breakdown
+
+    # Update the cached rate after an item's count or multiplier changed
+    def update_item_rate(self, item_type):
+        item_rate = self.item_counts[item_type] * ITEM_RATES[item_type] * self.item_multipliers[item_type]
+        self.rate += item_rate - self.item_rates[item_type]
+        self.item_rates[item_type] = item_rate
+
+    # Rebuild the cached rates from scratch, after the counts or multipliers were set directly
+    def recalculate_rates(self):
+        self.item_rates = [0] * NUM_ITEMS
+        self.rate = 0
+        for item_type in range(NUM_ITEMS):
+            self.update_item_rate(item_type)
+
+    # Each stage is another thousand times more pollution cleared in total
+    def get_achievement_stage(self):
+        return (self.total_pollution_cleared.digits() - 1) // 3
+
+    # ----------------- Advancing the simulation -----------------
+    # Move the game forward by dt seconds
+    def tick(self, dt):
+        gain = self.get_rate() * dt
+        self.pollution_cleared += gain
+        self.total_pollution_cleared += gain
+
+        self.update_upgrades()
+
+        # PPS (Pollution cleared Per Second) calculations
+        self.pps_time += dt
+        if self.pps_time >= 1 - 1e-9:
+            self.pps = self.pollution_cleared - self.previous_pollution_cleared
+            self.previous_pollution_cleared = self.pollution_cleared
+            self.pps_time = max(0, self.pps_time - 1)
+
+    # Show each upgrade once the one before it can be afforded.
+    # Every upgrade that became affordable is shown at once, even when the money jumped past several
+    def update_upgrades(self):
+        last_upgrade = len(UPGRADE_ORDER) - 1
+        if self.upgrade_count >= last_upgrade or self.money < UPGRADE_ORDER_COSTS[self.upgrade_count]:
+            return
+
+        upgrade_count = min(last_upgrade, bisect_right(UPGRADE_ORDER_COSTS, self.money))
+        for upgrade_order in range(self.upgrade_count + 1, upgrade_count + 1):
+            if not self.upgrades_purchased[upgrade_order]:
+                self.upgrades_shown.append(upgrade_order)
+
+        self.upgrade_count = upgrade_count
+        self.upgrades_version += 1
+
+    # ----------------- Offline progress -----------------
+    # The rate only changes when something is bought, so the pollution cleared over any amount of time
+    # can be added at once instead of tick by tick.
+    # Returns (stage, seconds) for each achievement stage reached, with the seconds into the catch up it was reached at
+    def catch_up(self, seconds):
+        reached = []
+        if seconds <= 0:
+            return reached
+
+        rate = self.get_rate()
+        gain = rate * seconds
+        final_total = self.total_pollution_cleared + gain
+
+        next_stage = self.get_achievement_stage() + 1
+        while rate > 0 and 1000 ** next_stage <= final_total:
+            reached.append((next_stage, float((1000 ** next_stage - self.total_pollution_cleared) / rate)))
+            next_stage += 1
+
+        self.pollution_cleared += gain
+        self.total_pollution_cleared = final_total
+
+        # The PPS while away was the rate the whole time
+        self.pps = BigNumber(rate)
+        self.previous_pollution_cleared = self.pollution_cleared
+        self.pps_time = 0
+
+        return reached
+
+    # Remember that the game is running right now
+    def mark_active(self, now=None):
+        self.last_active_time = time.time() if now is None else now
+
+    # Catch up on the time since the game was last running
+    def resume(self, now=None):
+        now = time.time() if now is None else now
+        elapsed = now - self.last_active_time
+        self.last_active_time = now
+
+        return self.catch_up(elapsed)
+
+    # ----------------- Player actions -----------------
+    # The earth was clicked
+    def click(self):
+        self.pollution_cleared += self.click_strength
+        self.total_pollution_cleared += self.click_strength
+
+    # The number of items that would be bought with an amount from BUY_AMOUNTS, and what they would cost.
+    # Buying the max when nothing can be afforded shows the price of one
+    def get_bulk_price(self, item_type, amount):
+        count = self.item_counts[item_type]
+        schedule = PRICE_SCHEDULES[item_type]
+
+        if amount == BUY_MAX:
+            amount = max(1, schedule.max_affordable(count, self.money))
+
+        return amount, schedule.cost(count, amount)
+
+    # Buys amount items, or as many as can be afforded with BUY_MAX.
+    # Returns whether the items could be bought
+    def buy_item(self, item_type, amount=1):
+        amount, cost = self.get_bulk_price(item_type, amount)
+        if math.isinf(cost) or self.money < cost:
+            return False
+
+        self.item_counts[item_type] += amount
+        self.money = round(self.money - cost)
+        self.item_prices[item_type] = PRICE_SCHEDULES[item_type].price(self.item_counts[item_type])
+
+        self.update_item_rate(item_type)
+
+        return True
+
+    # Returns whether the upgrade could be bought
+    def buy_upgrade(self, upgrade_order):
+        if self.upgrades_purchased[upgrade_order] or upgrade_order > self.upgrade_count:
+            return False
+
+        upgrade = UPGRADE_ORDER[upgrade_order]
+        price = UPGRADE_COSTS[upgrade[0]][upgrade[1]]
+        if self.money < price:
+            return False
+
+        self.money = round(self.money - price)
+        self.upgrades_purchased[upgrade_order] = True
+
+        for item_type in UPGRADE_ACTIONS[upgrade[0]]:
+            self.item_multipliers[item_type] += UPGRADE_RATES[upgrade[0]][upgrade[1]]
+            self.update_item_rate(item_type)
+
+        del self.upgrades_shown[bisect_left(self.upgrades_shown, upgrade_order)]
+        self.upgrades_version += 1
+
+        return True
+
+    # Sell the cleared pollution to gain money
+    def sell(self):
+        self.money = round(self.money + self.pollution_cleared, 1)
+        self.previous_pollution_cleared = BigNumber()
+        self.pollution_cleared = BigNumber()
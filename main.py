@@ -1,15 +1,18 @@
 
 # Import modules and code/classes/objects from other files
-import math
-
 import pygame.font
 
 from objects import *
 from messages import *
+from engine import GameState
+from save import AutoSaver, load_game
+from profiler import FrameProfiler
 
 
-# The Main function in which all the GUI code is ran
-def main():
+# The Main function in which all the GUI code is ran.
+# fps_cap of 0 runs as fast as possible, and frame_callback is called at the end of every frame.
+# These are used by benchmark.py
+def main(fps_cap=FPS_CAP, frame_callback=None):
 
     # ----------------- Initializing Pygame Variables -----------------
     pygame.init()
@@ -20,7 +23,7 @@ def main():
     screen.fill(SCREEN_COLOR)
     pygame.display.set_caption("Carbon Clicker")
 
-    application_icon = pygame.image.load(base_path + "images/carbon_clicker_logo.png")
+    application_icon = resources.image(base_path + "images/carbon_clicker_logo.png", None)
     pygame.display.set_icon(application_icon)
 
     logo = ImageRectObject((0, 0, 0, 0), (WIDTH // 2 - 200, HEIGHT // 2 - 200, 400, 400), 0, 0,
@@ -40,20 +43,24 @@ def main():
     start_button = RectTextButton(GOLD_COLOR, (WIDTH // 2 - 100, 600, 200, 60), 4, 50, action="start_game",
                                   text="Start", text_color=GOLD_COLOR, text_size=40)
 
-    stars = []
-
-    for star_i in range(400):
-        stars.append(Star((0, 0, WIDTH, HEIGHT)))
+    stars = create_stars((0, 0, WIDTH, HEIGHT), 400)
 
     starting = False
     transparency = 0
 
+    fade_surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
+    fade_surface.fill((0, 0, 0))
+
     # main_game(screen)
 
     # ----------------- The Main GUI Loop -----------------
     running = True
     while running:
 
+        # Set the FPS, and find how many 60 FPS frames the last frame took
+        frame_time = min(clock.tick(fps_cap) / 1000, MAX_FRAME_TIME)
+        frames = frame_time / ANIMATION_FRAME_TIME
+
         # ----------------- Looping through Pygame Events -----------------
         for event in pygame.event.get():
 
@@ -76,41 +83,45 @@ def main():
         displacement = ((mouse_pos[0] - WIDTH // 2) / 2400.0, (mouse_pos[1] - HEIGHT // 2) / 2400.0)
 
         for star in stars:
-            star.update_position(displacement)
+            star.update_position(displacement, frames)
             star.draw(screen, False)
 
         is_selected = start_button.is_selecting(mouse_pos)
 
         # Draw objects
-        draw_basic_objects(screen, basic_objects)
+        for basic_object in basic_objects:
+            basic_object.draw(screen, False)
         start_button.draw(screen, is_selected)
 
         if starting:
-            transparency = transparency + 2 + transparency * 0.1
-            new_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            new_surface.set_alpha(transparency)
-            new_surface.fill((0, 0, 0))
-            screen.blit(new_surface, (0, 0))
+            transparency = min(255, transparency + (2 + transparency * 0.1) * frames)
+            fade_surface.set_alpha(transparency)
+            screen.blit(fade_surface, (0, 0))
 
             if transparency >= 255:
-                main_game(screen)
+                main_game(screen, fps_cap=fps_cap, frame_callback=frame_callback)
                 break
 
-        # Set the FPS and update
-        clock.tick(60)
         pygame.display.update()
 
+        if frame_callback is not None:
+            frame_callback()
+
     # Once the loop has ended, quit the application
+    clear_caches()
     pygame.quit()
 
 
-def main_game(screen):
+# Runs the game itself. It plays the saved game, or a new one, unless it is given a state to play
+def main_game(screen, state=None, save_file=SAVE_FILE, fps_cap=FPS_CAP, frame_callback=None):
 
     # ----------------- Initializing Objects -----------------
     starting = True
     transparency = 255
 
-    time = 0  # Used for keeping track of seconds (60 ticks per second)
+    fade_surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
+    fade_surface.fill((0, 0, 0))
+
     clock = pygame.time.Clock()  # Clock for adjusting the frames per second
 
     # The Main Panels
@@ -130,15 +141,19 @@ def main_game(screen):
     upgrade_title_panel = RectTextObject((0, 0, 0, 0), LAYER_UPGRADE_TITLE_RECT, 0, 0, text="Upgrades:",
                                              text_color=GOLD_COLOR, text_size=30)
 
+    # The formatters for the numbers shown on the main panels
+    pollution_cleared_formatter = HUDNumberFormatter("Pollution Cleared: ", " lbs")
+    pps_formatter = HUDNumberFormatter("PPS: ")
+    money_formatter = HUDNumberFormatter("$: ")
+
     # ----------------- Sounds -----------------
-    click_sound = pygame.mixer.Sound("sounds/mouse_click.mp3")
+    click_sound = resources.sound(base_path + "sounds/mouse_click.mp3")
     click_sound.set_volume(0.4)
-    purchase_sound = pygame.mixer.Sound("sounds/purchase.mp3")
+    purchase_sound = resources.sound(base_path + "sounds/purchase.mp3")
     purchase_sound.set_volume(0.6)
-    achievement_sound = pygame.mixer.Sound("sounds/achievement_sound.mp3")
+    achievement_sound = resources.sound(base_path + "sounds/achievement_sound.mp3")
 
     # ----------------- Achievements -----------------
-    previous_achievement_stage = 0
     achievement = AchievementText((0, 0, 0, 0), (15,
                                                  LAYER_ACHIEVEMENT_TITLE_RECT[1] + LAYER_ACHIEVEMENT_TITLE_RECT[3]+15,
                                                  LAYER_ACHIEVEMENT_TITLE_RECT[2]-15, 135), 0, 0, text="",
@@ -146,20 +161,24 @@ def main_game(screen):
 
     # ----------------- Objects in their lists -----------------
 
-    # Create the first layer of basic objects
-    basic_objects_layer_1 = [
+    # The objects that never change are baked into one background surface
+    background = BakedBackground([
         ImageRectObject((100, 100, 100), LAYER_LEFT_RECT, 0, 0,
                         image_file=base_path + "images/left_background.png"),
         ImageRectObject((200, 200, 200), LAYER_MIDDLE_RECT, 0, 0,
                         image_file=base_path + "images/middle_background_border.png"),
         RectObject((0, 0, 0), LAYER_RIGHT_RECT, 0, 0),
         title_panel,
-        pollution_cleared_panel,
-        pps_panel,
-        money_panel,
         RectObject((0, 0, 0), LAYER_SCROLL_BAR_RECT, 0, 0),
         achievement_title_panel,
         upgrade_title_panel,
+    ])
+
+    # Create the first layer of basic objects, which are drawn on top of the background
+    basic_objects_layer_1 = [
+        pollution_cleared_panel,
+        pps_panel,
+        money_panel,
         achievement
     ]
 
@@ -168,10 +187,7 @@ def main_game(screen):
         item_panel
     ]
 
-    stars = []
-
-    for star_i in range(NUM_STARS):
-        stars.append(Star(LAYER_BOTTOM_RECT))
+    stars = create_stars(LAYER_BOTTOM_RECT, NUM_STARS)
 
     # ----------------- Scroll Bar -----------------
     holding_scroll_bar = False
@@ -179,15 +195,28 @@ def main_game(screen):
     scroll_bar = ScrollBar((0, 0, 0, 0), (LAYER_RIGHT_RECT[0] + 390, LAYER_RIGHT_RECT[1] + LAYER_ITEMS_RECT[3], 10, 50),
                            0, 0, image_file=base_path + "images/scroll_bar.png")
 
-    sell_button = ImageButton((0, 0, 0, 0), SELL_BUTTON_RECT, 0, 0, "SELL", "images/sell_button.png",
+    sell_button = ImageButton((0, 0, 0, 0), SELL_BUTTON_RECT, 0, 0, "SELL", base_path + "images/sell_button.png",
                               text="SELL!", text_color=GOLD_COLOR, text_size=30)
 
+    # Changes how many items are bought with each click
+    buy_amount_index = 0
+    buy_amount_button = RectTextButton(GOLD_COLOR, BUY_AMOUNT_BUTTON_RECT, 2, 10, "BUY_AMOUNT",
+                                       text=format_buy_amount(BUY_AMOUNTS[buy_amount_index]),
+                                       text_color=GOLD_COLOR, text_size=20)
+
     # ----------------- Buttons -----------------
     buttons = [
         scroll_bar,
         sell_button
     ]
 
+    # These buttons go above the items
+    panel_buttons = [
+        buy_amount_button
+    ]
+
+    selectable_buttons = panel_buttons + buttons
+
     # ----------------- Items -----------------
     item_popup = None
     items = []
@@ -199,48 +228,103 @@ def main_game(screen):
         items.append(Item((0, 0, 0, 0), (LAYER_RIGHT_RECT[0], item_base_y_pos + item_type * 100, 390, 100), 0, 0,
                           "ITEM", item_type, "", GOLD_COLOR, 25))
 
-    animation_text_list = []  # append later
+    # The popup shown when hovering over each item
+    item_popups = [ItemPopup((0, 0, 0, 0), (0, 0, 390, 100), 0, 0, base_path + "images/building_frame.png",
+                             popup_message=ITEM_INFO[item_type]) for item_type in range(NUM_ITEMS)]
+
+    # The text that rises from the earth when it is clicked
+    click_particles = ClickParticles(CLICK_PARTICLE_CAPACITY, GOLD_COLOR)
 
     # ----------------- Upgrades -----------------
-    upgrade_count = 0
-    upgrades_shown = [0]
     upgrades = []
     upgrade_popup = None
 
-    # Create the Upgrade objects
+    # Create the Upgrade objects. They are in the same order as UPGRADE_ORDER
     for _upgrade in range(len(UPGRADE_ORDER)):
         upgrades.append(Upgrade((0, 0, 0, 0),
                                 (0, LAYER_UPGRADE_TITLE_RECT[1] + LAYER_UPGRADE_TITLE_RECT[3], 73, 73),
                                  0, 0, "UPGRADE", (UPGRADE_ORDER[_upgrade][0], UPGRADE_ORDER[_upgrade][1]),
                                 "", (0, 0, 0), 0))
 
+    # The popup shown when hovering over each upgrade, indexed by the upgrade's position in UPGRADE_ORDER
+    upgrade_popups = [UpgradePopup((0, 0, 0, 0), (0, 0, 390, 100), 0, 0, base_path + "images/building_frame.png",
+                                   UPGRADE_COSTS[upgrade[0]][upgrade[1]],
+                                   popup_message=UPGRADE_INFO[upgrade[0]][upgrade[1]])
+                      for upgrade in UPGRADE_ORDER]
+
     # ----------------- Variables and internal Data -----------------
-    money = 0
+    # The economy of the game is kept in the GameState, and the GUI shows it
+    if state is None:
+        state, _ = load_game(save_file)
+    if state is None:
+        state = GameState()
+
+    # Catch up on the time since the game was saved.
+    # The stage is taken first, so achievements reached while away are celebrated on the first frame
+    previous_achievement_stage = state.get_achievement_stage()
+    state.resume()
 
-    pollution_cleared = 0
-    total_pollution_cleared = 0
-    previous_pollution_cleared = 0
-    pps = 0
+    # The upgrades are moved into place whenever this falls behind the state's upgrades_version
+    upgrades_version = None
 
-    click_strength = 0.2
-    max_click_interval = 3
+    autosaver = AutoSaver(save_file)
+    autosave_time = 0
+
+    max_click_interval = 3 / 60  # Seconds between clicks on the earth
     click_interval = 0
     can_click = True
 
+    # Seconds that have not been simulated yet
+    accumulator = 0
+
     hovering_earth = False
 
     # ----------------- Sprites -----------------
     earth_clicker = Earth(EARTH_CLICKER_RECT)
-    sprite_group = pygame.sprite.Group()
     sprites = [earth_clicker,]
-    sprite_group.add(sprites)
+
+    # ----------------- Layers -----------------
+    # Every layer is drawn on top of the ones before it
+    compositor = Compositor(SCREEN_SIZE, ["main_1", "items", "upgrades", "main_2", "sprites", "animated_text",
+                                          "item_popup", "upgrade_popup"])
 
     # Used to determine which objects are selected
     selected_object = None
 
+    # Finds the object under the mouse. It is rebuilt when the layout changes, like when scrolling
+    hit_test_grid = HitTestGrid((0, 0, WIDTH, HEIGHT))
+    layout_changed = True
+
+    # The mouse position is only updated by mouse events, and the selection is only
+    # worked out again when the mouse moved or the layout changed
+    mouse_pos = pygame.mouse.get_pos()
+    mouse_moved = True
+
+    # Used to only update the parts of the display that changed
+    dirty_tracker = DirtyRectTracker((0, 0, WIDTH, HEIGHT)) if DIRTY_RECT_RENDERING else None
+
+    # Measures how long each part of a frame takes. It only runs while its overlay is shown, or when writing a CSV
+    profiler = FrameProfiler(csv_file=PROFILER_CSV_FILE)
+    profiler_overlay = ProfilerOverlay((5, 5))
+    showing_profiler = False
+
     # ----------------- The Main GUI Loop -----------------
     running = True
     while running:
+        profiler.begin_frame()
+
+        # Set the FPS, and find how many 60 FPS frames the last frame took
+        frame_time = clock.tick(fps_cap) / 1000
+
+        # If the game was paused, catch up on the time it missed all at once.
+        # Any achievement stages reached are picked up by the achievement check later in this frame
+        if frame_time > MAX_FRAME_TIME:
+            state.catch_up(frame_time - MAX_FRAME_TIME)
+            frame_time = MAX_FRAME_TIME
+
+        frames = frame_time / ANIMATION_FRAME_TIME
+        state.mark_active()
+        profiler.mark("clock")
 
         # ----------------- Looping through Pygame Events -----------------
         for event in pygame.event.get():
@@ -249,9 +333,19 @@ def main_game(screen):
             if event.type == pygame.QUIT:
                 running = False
 
+            # Show or hide the profiler
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                showing_profiler = not showing_profiler
+                profiler.set_enabled(showing_profiler)
+
+            # ----------------- Mouse Moved -----------------
+            if event.type == pygame.MOUSEMOTION:
+                mouse_pos = event.pos
+                mouse_moved = True
+
             # ----------------- Mouse Clicked -----------------
             if event.type == pygame.MOUSEBUTTONDOWN:
-                location = pygame.mouse.get_pos()
+                location = event.pos
                 colliding_earth = earth_clicker.colliding(location)
 
                 # The earth was clicked
@@ -265,131 +359,112 @@ def main_game(screen):
 
             # ----------------- Mouse Released -----------------
             if event.type == pygame.MOUSEBUTTONUP:
-                location = pygame.mouse.get_pos()
+                location = event.pos
                 colliding_earth = earth_clicker.colliding(location)
 
                 # Calculate changes when the earth has been clicked
                 if can_click and colliding_earth:
                     click_sound.play()
                     earth_clicker.hover()
-                    pollution_cleared += click_strength
-                    total_pollution_cleared += click_strength
+                    state.click()
 
                     # Animations
-                    animation_rect = (location[0]+random.randint(-2, 2), location[1]+random.randint(-2, 2),
-                                      20, 10)
-                    animation_text_list.append(AnimatedText((0, 0, 0, 0), animation_rect, 0, 0,
-                                                text="+{} pollution cleared".format(click_strength),
-                                                text_color=(GOLD_COLOR[0], GOLD_COLOR[1], GOLD_COLOR[2], 255)))
+                    click_particles.spawn(location[0] + random.randint(-2, 2) + 10,
+                                          location[1] + random.randint(-2, 2) + 5,
+                                          "+{} pollution cleared".format(state.click_strength))
                     can_click = False
 
                 # An Item is being bought
-                if type(selected_object) == Item and money >= selected_object.price:
-                    selected_object.count += 1
-                    money = round(money - selected_object.price)
+                if type(selected_object) == Item and \
+                        state.buy_item(selected_object.item_type, BUY_AMOUNTS[buy_amount_index]):
                     purchase_sound.play()
 
-                    selected_object.price = round(selected_object.price * 1.1)
+                # Change how many items are bought
+                if selected_object == buy_amount_button:
+                    buy_amount_index = (buy_amount_index + 1) % len(BUY_AMOUNTS)
+                    buy_amount_button.text = format_buy_amount(BUY_AMOUNTS[buy_amount_index])
 
                 # An Upgrade is being bought
-                if type(selected_object) == Upgrade and money >= selected_object.price:
-                    money = round(money - selected_object.price)
-                    selected_object.purchased = True
-
-                    for i in range(len(selected_object.affected_items)):
-                        item = selected_object.affected_items[i]
-                        items[item].multiplier += selected_object.affected_rates
-
+                if type(selected_object) == Upgrade and state.buy_upgrade(selected_object.upgrade_order):
                     purchase_sound.play()
 
-                    upgrades_shown.remove(selected_object.upgrade_order)
-
                 # Selling the cleared pollution to gain money
                 if selected_object == sell_button:
-                    money = round(money + pollution_cleared, 1)
-                    previous_pollution_cleared = 0
-                    pollution_cleared = 0
+                    state.sell()
 
                 # Once the mouse has been released, stop holding the scroll bar
                 holding_scroll_bar = False
 
-        # ----------------- Calculations -----------------
+        profiler.mark("events")
 
-        # Calculate the current rate
-        rate = 0
-        for item in items:
-            rate += item.count * item.rate * item.multiplier
+        # ----------------- Calculations -----------------
+        # The economy moves forward in fixed steps, using up the real time that has passed
+        accumulator += frame_time
+        while accumulator >= SIMULATION_STEP:
+            state.tick(SIMULATION_STEP)
+            accumulator -= SIMULATION_STEP
 
-        pollution_cleared += rate / 60
-        total_pollution_cleared += rate / 60
+        profiler.mark("economy")
 
         # ----------------- Achievements -----------------
-        achievement_stage = int(math.log(int(max(1, total_pollution_cleared)), 1000))
+        achievement_stage = state.get_achievement_stage()
         if achievement_stage != previous_achievement_stage:
             achievement_sound.play()
 
-        earth_clicker.stage = min(4, achievement_stage)
-        earth_clicker.redraw()
+        earth_clicker.set_stage(min(4, achievement_stage))
 
         achievement.text = achievement_messages[min(6, achievement_stage)]
 
         previous_achievement_stage = achievement_stage
+        profiler.mark("achievements")
 
         # ----------------- Upgrade Calculations -----------------
-        if money >= UPGRADE_COSTS[UPGRADE_ORDER[min(len(UPGRADE_ORDER)-1, upgrade_count)][0]] \
-                [UPGRADE_ORDER[min(len(UPGRADE_ORDER)-1, upgrade_count)][1]] and upgrade_count < len(UPGRADE_ORDER)-1:
-            upgrade_count += 1
-            upgrades_shown.append(upgrade_count)
+        # Move the upgrades in the correct order, with the most expensive first.
+        # They only move when an upgrade is shown or purchased
+        if state.upgrades_version != upgrades_version:
+            upgrades_version = state.upgrades_version
 
-        # Move the upgrades in the correct order
-        for upgrade in upgrades:
-            if upgrade.upgrade_order in upgrades_shown:
-                upgrade.move(len(upgrades_shown) - 1 - upgrades_shown.index(upgrade.upgrade_order))
+            for position, upgrade_order in enumerate(reversed(state.upgrades_shown)):
+                if upgrades[upgrade_order].move(position):
+                    layout_changed = True
 
-        # ----------------- Formatting information for viewing -----------------
+        profiler.mark("upgrades")
 
-        # Display numbers with abbreviations and correct formatting
-        pollution_cleared_digits = len(str(int(pollution_cleared)))
-
-        # Pollution Cleared calculations
-        num_power = int(math.log(int(max(1, pollution_cleared)), 1000))
-        pollution_cleared_formatted = str(round(pollution_cleared / (1000 ** num_power), 1)) + \
-                                             NUMBER_SUFFIX[num_power]
-
-        pollution_cleared_panel.text = "Pollution Cleared: " + \
-                                       " " * (6 - pollution_cleared_digits) + \
-                                       pollution_cleared_formatted + " lbs"
+        # ----------------- Formatting information for viewing -----------------
+        # The pollution cleared is shown in between simulation steps
+        pollution_cleared = state.pollution_cleared + state.get_rate() * accumulator
+        pps = state.pps
+        money = state.money
+
+        # Display numbers with abbreviations and correct formatting.
+        # The formatters hand back the same text until the shown number changes
+        pollution_cleared_panel.text = pollution_cleared_formatter.format(pollution_cleared)
+        pps_panel.text = pps_formatter.format(pps)
+        money_panel.text = money_formatter.format(money)
+        profiler.mark("formatting")
 
-        # PPS (Pollution cleared Per Second) calculations
-        current_pps_digits = len(str(int(pps)))
+        # ----------------- Mouse and Selection -----------------
+        # Nothing under the mouse can change while it stays still and nothing moves
+        if layout_changed or mouse_moved:
 
-        num_power = int(math.log(max(1, int(pps)), 1000))
-        pps_formatted = str(round(pps / (1000 ** num_power), 1)) + \
-                                             NUMBER_SUFFIX[num_power]
-        pps_panel.text = "PPS: " + \
-                         " " * (6 - current_pps_digits) + pps_formatted
+            # Hidden upgrades can not be selected
+            if layout_changed:
+                hit_test_grid.rebuild([selectable_buttons, items,
+                                       [upgrade for upgrade in upgrades if not upgrade.hidden]])
 
-        # Money calculations
-        money_digits = len(str(int(money)))
+            selected_object = hit_test_grid.get_object(mouse_pos)
+            colliding_earth = earth_clicker.colliding(mouse_pos)
+            if not colliding_earth and hovering_earth:
+                hovering_earth = False
+                earth_clicker.resize_normal()
+            if not hovering_earth and colliding_earth:
+                hovering_earth = True
+                earth_clicker.hover()
 
-        num_power = int(math.log(int(max(1, money)), 1000))
-        money_formatted = str(round(money / (1000 ** num_power), 1)) + \
-                                             NUMBER_SUFFIX[num_power]
+            layout_changed = False
+            mouse_moved = False
 
-        money_panel.text = "$: " + \
-                           " " * (6 - money_digits) + \
-                           money_formatted
-
-        # ----------------- Mouse and Selection -----------------
-        mouse_pos = pygame.mouse.get_pos()
-        selected_object = get_selected_object(mouse_pos, buttons, items, upgrades)
-        colliding_earth = earth_clicker.colliding(mouse_pos)
-        if not colliding_earth and hovering_earth:
-            hovering_earth = False
-            earth_clicker.resize_normal()
-        if not hovering_earth and colliding_earth:
-            hovering_earth = True
-            earth_clicker.hover()
+        profiler.mark("selection")
 
         # ----------------- Scroll Bar Movement -----------------
         if holding_scroll_bar:
@@ -408,27 +483,30 @@ def main_game(screen):
 
                 starting_mouse_y += offset
 
-        # Scroll the items based on the scroll bar's movement
-        scroll_items(items, item_base_y_pos)
+                # Scroll the items based on the scroll bar's movement
+                scroll_items(items, item_base_y_pos)
+                layout_changed = True
+
+        profiler.mark("scroll")
 
         # ----------------- Popup Information -----------------
 
-        # Item popups with descriptions about the items
+        # Item popups with descriptions about the items.
+        # Each item and upgrade has its own popup, which only has to be moved next to it
         if type(selected_object) == Item and not selected_object.hidden:
-            item_popup = ItemPopup((0, 0, 0, 0),
-                                   (selected_object.x - 390, selected_object.y, 390, 100), 0, 0,
-                                   base_path + "images/building_frame.png",
-                                   popup_message=ITEM_INFO[selected_object.item_type])
+            item_popup = item_popups[selected_object.item_type]
+            item_popup.x = selected_object.x - 390
+            item_popup.y = selected_object.y
         elif type(selected_object) == Upgrade and not selected_object.hidden:
-            upgrade_popup = UpgradePopup((0, 0, 0, 0),
-                                         (selected_object.x + selected_object.width, selected_object.y, 390, 100), 0, 0,
-                                         base_path + "images/building_frame.png",
-                                         UPGRADE_COSTS[selected_object.item_type][selected_object.tier],
-                                         popup_message=UPGRADE_INFO[selected_object.item_type][selected_object.tier])
+            upgrade_popup = upgrade_popups[selected_object.upgrade_order]
+            upgrade_popup.x = selected_object.x + selected_object.width
+            upgrade_popup.y = selected_object.y
         else:
             item_popup = None
             upgrade_popup = None
 
+        profiler.mark("popups")
+
         # ----------------- Redrawing and Updating -----------------
 
         screen.fill(SCREEN_COLOR)
@@ -438,68 +516,113 @@ def main_game(screen):
         displacement = ((mouse_pos[0] - earth_center[0]) / 2400.0, (mouse_pos[1] - earth_center[1]) / 2400.0)
 
         for star in stars:
-            star.update_position(displacement)
+            star.update_position(displacement, frames)
             star.draw(screen, False)
 
-        draw_main_objects_1(screen, selected_object, basic_objects_layer_1, buttons)
-        draw_items(screen, selected_object, items, money)
-        draw_upgrades(screen, selected_object, upgrades, money, upgrade_count)
-        draw_main_objects_2(screen, basic_objects_layer_2)
+        profiler.mark("stars")
+
+        background.draw(screen, False)
+
+        compositor.clear()
+        profiler.mark("background")
 
-        earth_clicker.animate()
-        sprite_group.draw(screen)
-        draw_animated_text(screen, animation_text_list)
-        draw_item_popup(screen, item_popup)
-        draw_upgrade_popup(screen, upgrade_popup)
+        # With batched blitting, most of the blitting happens when the layers are composited
+        draw_main_objects_1(compositor.get_layer("main_1"), selected_object, basic_objects_layer_1, buttons)
+        profiler.mark("draw_main_1")
+        draw_items(compositor.get_layer("items"), selected_object, items, state, BUY_AMOUNTS[buy_amount_index])
+        profiler.mark("draw_items")
+        if draw_upgrades(compositor.get_layer("upgrades"), selected_object, upgrades, state):
+            layout_changed = True
+        profiler.mark("draw_upgrades")
+        draw_main_objects_2(compositor.get_layer("main_2"), selected_object, basic_objects_layer_2, panel_buttons)
+        profiler.mark("draw_main_2")
+
+        earth_clicker.animate(frame_time)
+        draw_basic_objects(compositor.get_layer("sprites"), sprites)
+        profiler.mark("earth")
+        draw_click_particles(compositor.get_layer("animated_text"), click_particles, frames)
+        profiler.mark("particles")
+        draw_item_popup(compositor.get_layer("item_popup"), item_popup)
+        draw_upgrade_popup(compositor.get_layer("upgrade_popup"), upgrade_popup)
+        profiler.mark("draw_popups")
+
+        compositor.composite(screen)
 
         if starting:
-            transparency = max(transparency - 1 - (255 - transparency) * 0.1, 0)
-            new_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            new_surface.set_alpha(transparency)
-            new_surface.fill((0, 0, 0))
-            screen.blit(new_surface, (0, 0))
+            transparency = max(transparency - (1 + (255 - transparency) * 0.1) * frames, 0)
+            fade_surface.set_alpha(transparency)
+            screen.blit(fade_surface, (0, 0))
 
             if transparency == 0:
                 starting = False
 
-        # Set the FPS and update
-        clock.tick(60)
-        pygame.display.update()
+        profiler.mark("composite")
+
+        if showing_profiler:
+            profiler_overlay.update(profiler)
+            profiler_overlay.draw(screen, False)
+
+        profiler.mark("profiler")
+
+        if dirty_tracker is None:
+            pygame.display.update()
+        else:
+            track_dirty_objects(dirty_tracker, selected_object, stars, [background], basic_objects_layer_1, buttons,
+                                items, upgrades, basic_objects_layer_2, panel_buttons, sprites, [click_particles],
+                                [popup for popup in (item_popup, upgrade_popup) if popup is not None],
+                                [profiler_overlay] if showing_profiler else [])
+
+            # The whole screen changes while fading in
+            if starting:
+                dirty_tracker.full_update = True
+
+            pygame.display.update(dirty_tracker.get_dirty_rects())
+
+        profiler.mark("display_update")
 
-        # ----------------- PPS (Pollution cleared Per Second) Calculations -----------------
-        time += 1
+        # ----------------- Autosave -----------------
+        autosave_time += frame_time
+        if autosave_time >= AUTOSAVE_INTERVAL:
+            autosave_time = 0
+            autosaver.save(state)
+
+        # ----------------- Click Cooldown -----------------
         if not can_click:
-            click_interval += 1
+            click_interval += frame_time
         if click_interval >= max_click_interval:
             can_click = True
             click_interval = 0
-        if time == 60:
-            pps = pollution_cleared - previous_pollution_cleared
-            previous_pollution_cleared = pollution_cleared
-            time = 0
+
+        profiler.mark("autosave")
+        profiler.end_frame()
+
+        if frame_callback is not None:
+            frame_callback()
 
         # ----------------- End of Loop -----------------
 
+    # Save before quitting
+    autosaver.save(state)
+    autosaver.stop()
+    profiler.stop()
+
     # Once the loop has ended, quit the application
+    clear_caches()
     pygame.quit()
 
 
-# If the mouse is touching an object that can be selected, return it.
-# Else, return None for no selected object
-def get_selected_object(mouse_pos, buttons, items, upgrades):
-    for button in buttons:
-        if button.is_selecting(mouse_pos):
-            return button
-
-    for item in items:
-        if item.is_selecting(mouse_pos):
-            return item
+# Tell the dirty rectangle tracker about every object that was drawn this frame
+def track_dirty_objects(dirty_tracker, selected_object, *object_lists):
+    for objects in object_lists:
+        for drawable in objects:
+            dirty_tracker.track(drawable, drawable == selected_object)
 
-    for upgrade in upgrades:
-        if not upgrade.hidden and upgrade.is_selecting(mouse_pos):
-            return upgrade
 
-    return None
+# The text on the buy amount button
+def format_buy_amount(buy_amount):
+    if buy_amount == BUY_MAX:
+        return "MAX"
+    return "x{}".format(buy_amount)
 
 
 # Scroll the items/machines based on the base y position
@@ -509,103 +632,84 @@ def scroll_items(items, item_base_y_pos):
 
 
 # Draw basic objects such as a rectangle
-def draw_basic_objects(surface, objects):
+def draw_basic_objects(layer, objects):
     for basic_object in objects:
-        basic_object.draw(surface, False)
+        layer.draw(basic_object, False)
 
 
 # Draw the buttons
-def draw_buttons(surface, selected_object, buttons):
+def draw_buttons(layer, selected_object, buttons):
     for button in buttons:
         if button == selected_object:
-            button.draw(surface, True)
+            layer.draw(button, True)
         else:
-            button.draw(surface, False)
+            layer.draw(button, False)
 
 
 # buttons and other main components. This draws the first layer
-def draw_main_objects_1(screen, selected_object, basic_objects_layer_1, buttons):
-
-    surface1 = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
-    draw_basic_objects(surface1, basic_objects_layer_1)
-
-    surface3 = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
-    draw_buttons(surface3, selected_object, buttons)
-
-    surface1.blit(surface3, (0, 0))
-    screen.blit(surface1, (0, 0))
+def draw_main_objects_1(layer, selected_object, basic_objects_layer_1, buttons):
+    draw_basic_objects(layer, basic_objects_layer_1)
+    draw_buttons(layer, selected_object, buttons)
 
 
 # buttons and other main components. This draws the second layer
-def draw_main_objects_2(screen, basic_objects_layer_2):
-    surface1 = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
-    draw_basic_objects(surface1, basic_objects_layer_2)
-    screen.blit(surface1, (0, 0))
-
-
-# Draws animated text and moves it every frame
-def draw_animated_text(screen, animated_texts):
-    surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
+def draw_main_objects_2(layer, selected_object, basic_objects_layer_2, panel_buttons):
+    draw_basic_objects(layer, basic_objects_layer_2)
+    draw_buttons(layer, selected_object, panel_buttons)
 
-    indexes = []  # stuff to be removed
-    for i in range(len(animated_texts)):
-        animated_text = animated_texts[i]
-        animated_text.draw(surface, False)
-        remove = animated_text.move()
-        if remove:
-            indexes.append(i)
 
-    for removal in indexes:
-        animated_texts.pop(removal)
+# Draws the click animations and moves them every frame
+def draw_click_particles(layer, click_particles, frames):
+    if click_particles.count == 0:
+        return
 
-    screen.blit(surface, (0, 0))
+    layer.draw(click_particles, False)
+    click_particles.move(frames)
 
 
 # Draw all the items and calculate their visibility
-def draw_items(screen, selected_object, items, money):
-    surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
-
+def draw_items(layer, selected_object, items, state, buy_amount):
     for item in items:
-        item.hidden = item.item_type != 0 and item.hidden and money < ITEM_PRICES[item.item_type-1]
+        item.hidden = item.item_type != 0 and item.hidden and state.money < ITEM_PRICES[item.item_type-1] and \
+            state.item_counts[item.item_type] == 0
 
-        item.enough = money >= item.price
-        item.draw(surface, selected_object == item)
+        item.count = state.item_counts[item.item_type]
+        item.amount, item.price = state.get_bulk_price(item.item_type, buy_amount)
+        item.enough = state.money >= item.price
+        layer.draw(item, selected_object == item)
 
-    screen.blit(surface, (0, 0))
-
-
-# Draw all the upgrades and calculate their visibility
-def draw_upgrades(screen, selected_object, upgrades, money, upgrade_count):
-    surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
 
+# Draw all the upgrades and calculate their visibility.
+# Returns whether any upgrade was shown or hidden
+def draw_upgrades(layer, selected_object, upgrades, state):
+    visibility_changed = False
     for upgrade in upgrades:
-        upgrade.hidden = upgrade.purchased or upgrade_count < upgrade.upgrade_order
-        upgrade.enough = money >= upgrade.price
-        upgrade.draw(surface, selected_object == upgrade)
+        upgrade.purchased = state.upgrades_purchased[upgrade.upgrade_order]
+        hidden = upgrade.purchased or state.upgrade_count < upgrade.upgrade_order
+        if hidden != upgrade.hidden:
+            upgrade.hidden = hidden
+            visibility_changed = True
+
+        upgrade.enough = state.money >= upgrade.price
+        layer.draw(upgrade, selected_object == upgrade)
 
-    screen.blit(surface, (0, 0))
+    return visibility_changed
 
 
 # Draw the item popup if it exists
-def draw_item_popup(screen, item_popup):
+def draw_item_popup(layer, item_popup):
     if item_popup is None:
         return
 
-    surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
-    item_popup.draw(surface, False)
-
-    screen.blit(surface, (0, 0))
+    layer.draw(item_popup, False)
 
 
 # Draw the Upgrade popup if it exists
-def draw_upgrade_popup(screen, upgrade_popup):
+def draw_upgrade_popup(layer, upgrade_popup):
     if upgrade_popup is None:
         return
 
-    surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
-    upgrade_popup.draw(surface, False)
-
-    screen.blit(surface, (0, 0))
+    layer.draw(upgrade_popup, False)
 
 
 # Run the main function
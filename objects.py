@@ -1,6 +1,17 @@
 import pygame
 import random
+from array import array
+from collections import OrderedDict
 from constants import *
+from big_number import BigNumber, format_scaled, get_power, get_scale
+from cache import LRUCache
+from text_layout import text_layouts
+
+# NumPy is optional, and is only used to update and draw the stars all at once
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 '''
@@ -9,6 +20,344 @@ A lot of Object Oriented Programming exists in this file.
 '''
 
 
+# ----------------- The Resource Manager -----------------
+# Loads every image, font, and sound only once, and hands out the shared copy afterwards.
+# Images are keyed by their path and conversion mode ("alpha", "opaque", or None for no conversion),
+# fonts by their path and size, and sounds by their path.
+class ResourceManager:
+    def __init__(self):
+        self.images = {}
+        self.fonts = {}
+        self.sounds = {}
+        self.shades = {}
+
+    def image(self, image_file, convert="alpha"):
+        key = (image_file, convert)
+        if key not in self.images:
+            image = pygame.image.load(image_file)
+            if convert == "alpha":
+                image = image.convert_alpha()
+            elif convert == "opaque":
+                image = image.convert()
+            self.images[key] = image
+
+        return self.images[key]
+
+    def font(self, font_file, size):
+        key = (font_file, size)
+        if key not in self.fonts:
+            self.fonts[key] = pygame.font.Font(font_file, size)
+
+        return self.fonts[key]
+
+    def sound(self, sound_file):
+        if sound_file not in self.sounds:
+            self.sounds[sound_file] = pygame.mixer.Sound(sound_file)
+
+        return self.sounds[sound_file]
+
+    # A see-through black surface that darkens whatever it is drawn over,
+    # used when objects are selected or cannot be bought
+    def shade(self, size, alpha):
+        key = (size, alpha)
+        if key not in self.shades:
+            shade = pygame.Surface(size, pygame.SRCALPHA)
+            shade.set_alpha(alpha)
+            shade.fill((0, 0, 0))
+            self.shades[key] = shade
+
+        return self.shades[key]
+
+    # Forget everything that was loaded. Fonts and surfaces can not be used after pygame quits
+    def clear(self):
+        self.images.clear()
+        self.fonts.clear()
+        self.sounds.clear()
+        self.shades.clear()
+
+
+# The shared resource manager used by every object
+resources = ResourceManager()
+
+
+# ----------------- The Text Cache -----------------
+# (extends LRUCache)
+# Remembers rendered text surfaces, so text that does not change is only rendered once.
+# Surfaces are keyed by (font, size, text, color, antialias)
+class TextCache(LRUCache):
+    def __init__(self, max_surfaces=512):
+        super().__init__(max_surfaces)
+
+    def render(self, font_file, size, text, color, antialias=True):
+        return self.get((font_file, size, text, color, antialias), self.render_surface,
+                        font_file, size, text, color, antialias)
+
+    def render_surface(self, font_file, size, text, color, antialias):
+        return resources.font(font_file, size).render(text, antialias, color)
+
+
+# The shared text cache used by every text object
+text_cache = TextCache()
+
+
+# ----------------- The HUD Number Formatter -----------------
+# Formats a number for a HUD panel, like "$:    12.3K", padded so the panel text does not jump around.
+# The text is only built again when the number changes at the one decimal place that is shown.
+# The power of a thousand is kept until the number leaves its range, so most frames only divide and round.
+class HUDNumberFormatter:
+    def __init__(self, prefix, postfix=""):
+        self.prefix = prefix
+        self.postfix = postfix
+
+        # The range of numbers shown with the current power of a thousand
+        self.power = None
+        self.scale = None
+        self.low = None
+        self.high = None
+
+        self.shown = None
+        self.digits = None
+        self.text = ""
+
+    def set_power(self, number):
+        self.power = get_power(number)
+        self.scale = get_scale(self.power)
+        self.low = self.scale if self.power > 0 else None
+        self.high = get_scale(self.power + 1)
+
+    def format(self, number):
+        if self.power is None or number >= self.high or (self.low is not None and number < self.low):
+            self.set_power(number)
+
+        scaled = float(number / self.scale)
+        shown = round(scaled, 1)
+        digits = self.power * 3 + (3 if scaled >= 100 else 2 if scaled >= 10 else 1)
+        if shown == self.shown and digits == self.digits:
+            return self.text
+
+        self.shown = shown
+        self.digits = digits
+
+        self.text = self.prefix + " " * (6 - digits) + format_scaled(shown, self.power) + self.postfix
+
+        return self.text
+
+
+# ----------------- The Dirty Rectangle Tracker -----------------
+# Works like pygame.sprite.LayeredDirty, but for the Object classes.
+# The tracker remembers what every object looked like when it was last drawn,
+# and only reports the areas of the screen where something changed, so only those need to be updated.
+class DirtyRectTracker:
+    def __init__(self, screen_rect, max_rects=64):
+        self.screen_rect = pygame.Rect(screen_rect)
+        self.max_rects = max_rects
+
+        self.drawn = {}  # The state and rect of every object from the last frame
+        self.tracked = {}  # The state and rect of every object from this frame
+        self.rects = []
+
+        self.full_update = True
+
+    # Call this for every object that was drawn this frame
+    def track(self, drawable, selected=False):
+        state = drawable.get_draw_state(selected)
+        previous = self.drawn.pop(drawable, None)
+
+        if previous is not None and previous[0] == state:
+            self.tracked[drawable] = previous
+            return
+
+        rect = drawable.get_rect().inflate(2, 2)
+        self.rects.append(rect)
+        if previous is not None:
+            self.rects.append(previous[1])
+
+        self.tracked[drawable] = (state, rect)
+
+    # Returns the areas of the screen that changed since the last frame
+    def get_dirty_rects(self):
+
+        # Objects that were not drawn this frame leave their old area behind
+        for state, rect in self.drawn.values():
+            self.rects.append(rect)
+
+        self.drawn = self.tracked
+        self.tracked = {}
+
+        rects = self.rects
+        self.rects = []
+
+        if self.full_update:
+            self.full_update = False
+            return [self.screen_rect]
+
+        if len(rects) > self.max_rects:
+            return [rects[0].unionall(rects).clip(self.screen_rect)]
+
+        return [rect.clip(self.screen_rect) for rect in rects]
+
+
+# ----------------- The Blit Batch -----------------
+# Stands in for a surface that objects draw on, but only remembers their blits,
+# and then hands them all to pygame in one Surface.blits call (or fblits, where pygame has it).
+# Each blit returns the area it will cover, just like Surface.blit does.
+# Anything that is blitted must not change until the batch is flushed.
+class BlitBatch:
+    def __init__(self, surface):
+        self.surface = surface
+        self.fblits = getattr(surface, "fblits", None)
+
+        self.blit_sequence = []
+        self.simple = True  # Whether every blit is only a source and a destination, which is all fblits takes
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        if area is None and special_flags == 0:
+            self.blit_sequence.append((source, dest))
+            size = source.get_size()
+        else:
+            self.blit_sequence.append((source, dest, area, special_flags))
+            self.simple = False
+            size = pygame.Rect(area).size if area is not None else source.get_size()
+
+        if isinstance(dest, pygame.Rect):
+            dest = dest.topleft
+
+        # Surface.blit moves an area that is not on the surface at all to the clipping area's edge
+        clip = self.surface.get_clip()
+        rect = pygame.Rect(dest, size).clip(clip)
+        if rect.width == 0 or rect.height == 0:
+            return pygame.Rect(max(int(dest[0]), clip.x), max(int(dest[1]), clip.y), 0, 0)
+
+        return rect
+
+    def flush(self):
+        if not self.blit_sequence:
+            return
+
+        if self.simple and self.fblits is not None:
+            self.fblits(self.blit_sequence)
+        else:
+            self.surface.blits(self.blit_sequence, False)
+
+        self.blit_sequence = []
+        self.simple = True
+
+
+# ----------------- The Layer -----------------
+# A see-through surface the size of the screen, which is kept between frames instead of being created every frame.
+# It remembers the areas that were drawn on, so only those need to be cleared and blitted.
+# Objects that only blit are drawn through a BlitBatch when BATCHED_BLITTING is on.
+class Layer:
+    def __init__(self, size):
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.drawn_rects = []
+
+        self.batch = BlitBatch(self.surface) if BATCHED_BLITTING else None
+
+    def draw(self, drawable, selected=False):
+        if self.batch is not None and drawable.is_batchable():
+            drawable.draw(self.batch, selected)
+        else:
+            # Anything batched so far has to be drawn first, to keep the order
+            self.flush()
+            drawable.draw(self.surface, selected)
+
+        self.drawn_rects.append(drawable.get_rect())
+
+    def flush(self):
+        if self.batch is not None:
+            self.batch.flush()
+
+    def clear(self):
+        for rect in self.drawn_rects:
+            self.surface.fill((0, 0, 0, 0), rect)
+        self.drawn_rects = []
+
+    # Returns the blit that puts this layer onto the screen, or None if nothing was drawn
+    def get_blit(self):
+        if not self.drawn_rects:
+            return None
+
+        self.flush()
+
+        drawn_area = self.drawn_rects[0].unionall(self.drawn_rects)
+        return self.surface, drawn_area.topleft, drawn_area
+
+    def blit_onto(self, screen):
+        layer_blit = self.get_blit()
+        if layer_blit is not None:
+            screen.blit(*layer_blit)
+
+
+# ----------------- The Compositor -----------------
+# Owns a Layer for each part of the game, and blits them onto the screen in order, from back to front
+class Compositor:
+    def __init__(self, size, layer_names):
+        self.layers = OrderedDict()
+        for layer_name in layer_names:
+            self.layers[layer_name] = Layer(size)
+
+    def get_layer(self, layer_name):
+        return self.layers[layer_name]
+
+    # Clear whatever was drawn last frame
+    def clear(self):
+        for layer in self.layers.values():
+            layer.clear()
+
+    def composite(self, screen):
+        if not BATCHED_BLITTING:
+            for layer in self.layers.values():
+                layer.blit_onto(screen)
+            return
+
+        layer_blits = [layer.get_blit() for layer in self.layers.values()]
+        screen.blits([layer_blit for layer_blit in layer_blits if layer_blit is not None], False)
+
+
+# ----------------- The Hit Test Grid -----------------
+# Splits the screen into square cells, and remembers which objects overlap each cell.
+# Finding the object under the mouse then only checks the few objects in one cell,
+# however many items and upgrades there are. It has to be rebuilt whenever the objects move.
+class HitTestGrid:
+    def __init__(self, rect, cell_size=50):
+        self.x, self.y, self.width, self.height = rect
+        self.cell_size = cell_size
+
+        self.columns = -(-self.width // cell_size)
+        self.rows = -(-self.height // cell_size)
+        self.cells = [[] for _ in range(self.columns * self.rows)]
+
+    # Objects in earlier lists are on top of objects in later ones
+    def rebuild(self, object_lists):
+        for cell in self.cells:
+            cell.clear()
+
+        for objects in object_lists:
+            for selectable in objects:
+                first_column = max(0, int(selectable.x - self.x) // self.cell_size)
+                last_column = min(self.columns - 1, int(selectable.x + selectable.width - self.x) // self.cell_size)
+                first_row = max(0, int(selectable.y - self.y) // self.cell_size)
+                last_row = min(self.rows - 1, int(selectable.y + selectable.height - self.y) // self.cell_size)
+
+                for row in range(first_row, last_row + 1):
+                    for column in range(first_column, last_column + 1):
+                        self.cells[row * self.columns + column].append(selectable)
+
+    # Returns the topmost object under the position, or None
+    def get_object(self, position):
+        column = int(position[0] - self.x) // self.cell_size
+        row = int(position[1] - self.y) // self.cell_size
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return None
+
+        for selectable in self.cells[row * self.columns + column]:
+            if selectable.is_selecting(position):
+                return selectable
+
+        return None
+
+
 # ----------------- The main Object class -----------------
 class Object:
     def __init__(self, rect):
@@ -17,6 +366,56 @@ class Object:
         self.width = rect[2]
         self.height = rect[3]
 
+    # The area of the screen that the object draws on
+    def get_rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
+
+    # Everything that changes how the object looks.
+    # If it is the same as last frame, the object does not need to be updated on the display.
+    def get_draw_state(self, selected):
+        return self.x, self.y, self.width, self.height, selected
+
+    # Whether draw only ever blits, so it can be drawn through a BlitBatch
+    def is_batchable(self):
+        return False
+
+
+# ----------------- The Baked Background -----------------
+# (extends Object)
+# Objects that never change are drawn onto one surface once, which is then blitted every frame.
+# The surface is only baked again when the screen size or the look of one of the objects changes.
+class BakedBackground(Object):
+    def __init__(self, static_objects, size=SCREEN_SIZE):
+        super().__init__((0, 0, size[0], size[1]))
+        self.static_objects = static_objects
+
+        self.surface = None
+        self.baked_layout = None
+
+    # The screen size along with the state of every static object
+    def get_layout(self):
+        layout = [(self.width, self.height)]
+        for static_object in self.static_objects:
+            layout.append(static_object.get_draw_state(False))
+        return layout
+
+    def bake(self):
+        self.surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+        for static_object in self.static_objects:
+            static_object.draw(self.surface, False)
+
+        self.baked_layout = self.get_layout()
+
+    def draw(self, surface, selected):
+        self.width, self.height = surface.get_size()
+        if self.get_layout() != self.baked_layout:
+            self.bake()
+
+        surface.blit(self.surface, (0, 0))
+
+    def get_draw_state(self, selected):
+        return self.baked_layout
+
 
 # ----------------- A circular Object -----------------
 # (extends Object)
@@ -36,6 +435,12 @@ class CircleObject(Object):
             pygame.draw.circle(surface, self.color,
                               (self.x, self.y), self.radius, self.thickness)
 
+    def get_rect(self):
+        return pygame.Rect(self.x - self.radius, self.y - self.radius, self.radius * 2 + 1, self.radius * 2 + 1)
+
+    def get_draw_state(self, selected):
+        return self.x, self.y, self.radius, self.color
+
 
 # ----------------- A rectangular Object -----------------
 # (extends Object)
@@ -54,6 +459,13 @@ class RectObject(Object):
             pygame.draw.rect(surface, self.color,
                              (self.x, self.y, self.width, self.height), self.border, self.radius)
 
+    def get_draw_state(self, selected):
+        return super().get_draw_state(selected) + (self.color,)
+
+    # A see-through rectangle is not drawn at all
+    def is_batchable(self):
+        return len(self.color) == 4 and self.color[3] == 0
+
 
 # ----------------- A rectangular Object with an image -----------------
 # (extends RectObject)
@@ -61,11 +473,17 @@ class ImageRectObject(RectObject):
     def __init__(self, color, rect, border, radius, image_file):
         super().__init__(color, rect, border, radius)
         self.image_file = image_file
-        self.image = pygame.image.load(self.image_file).convert_alpha()
+        self.image = resources.image(self.image_file)
 
     def draw(self, surface, selected):
         surface.blit(self.image, (self.x, self.y))
 
+    def get_rect(self):
+        return super().get_rect().union(self.image.get_rect(topleft=(self.x, self.y)))
+
+    def is_batchable(self):
+        return True
+
 
 # ----------------- The Rectangular Text Object -----------------
 # (extends RectObject)
@@ -78,17 +496,30 @@ class RectTextObject(RectObject):
         self.text = text
         self.text_color = text_color
 
-        self.font = pygame.font.Font('fonts/HackbotFreeTrial-8MgA2.otf',
-                                     text_size)
-        self.text_surf = self.font.render(self.text, True, self.text_color)
+        self.font_file = FONT_FILE
+        self.font = resources.font(self.font_file, text_size)
+        self.text_surf = self.render_text(self.text, self.text_color)
 
     def draw(self, surface, selected):
         super().draw(surface, selected)
         if self.text != '':
-            self.text_surf = self.font.render(self.text, True, self.text_color)
+            self.text_surf = self.render_text(self.text, self.text_color)
             surface.blit(self.text_surf, (self.x + (self.width / 2 - self.text_surf.get_width() / 2),
                                           self.y + (self.height / 2 - self.text_surf.get_height() / 2)))
 
+    # Renders text with this object's font through the shared text cache
+    def render_text(self, text, color):
+        return text_cache.render(self.font_file, self.text_size, text, color)
+
+    # Centered text can be wider than the object itself
+    def get_rect(self):
+        rect = super().get_rect()
+        text_rect = self.text_surf.get_rect(center=rect.center)
+        return rect.union(text_rect)
+
+    def get_draw_state(self, selected):
+        return super().get_draw_state(selected) + (self.text, self.text_color)
+
 
 # ----------------- The Image Rectangular Text Object -----------------
 # (extends RectTextObject)
@@ -96,14 +527,20 @@ class ImageRectTextObject(RectTextObject):
     def __init__(self, color, rect, border, radius, image_file, text='', text_color=(0, 0, 0), text_size=10):
         super().__init__(color, rect, border, radius, text, text_color, text_size)
         self.image_file = image_file
-        self.image = pygame.image.load(self.image_file).convert_alpha()
+        self.image = resources.image(self.image_file)
 
     def draw(self, surface, selected):
         surface.blit(self.image, (self.x, self.y))
-        self.text_surf = self.font.render(self.text, True, self.text_color)
+        self.text_surf = self.render_text(self.text, self.text_color)
         surface.blit(self.text_surf, (self.x + (self.width / 2 - self.text_surf.get_width() / 2),
                                       self.y + (self.height / 2 - self.text_surf.get_height() / 2)))
 
+    def get_rect(self):
+        return super().get_rect().union(self.image.get_rect(topleft=(self.x, self.y)))
+
+    def is_batchable(self):
+        return True
+
 
 # ----------------- Achievements -----------------
 # (extends RectTextObject)
@@ -111,52 +548,117 @@ class ImageRectTextObject(RectTextObject):
 class AchievementText(RectTextObject):
     def __init__(self, color, rect, border, radius, text='', text_color=(0, 0, 0, 255), text_size=20):
         super().__init__(color, rect, border, radius, text, text_color, text_size)
+        self.lines_rect = Object.get_rect(self)
 
     def draw(self, surface, selected):
-        max_char_per_line = 2 * (self.width - 30) // self.text_size
-        word_list = self.text.split()
-        lines = []
-        current_line = ""
+        self.lines_rect = Object.get_rect(self)
 
-        for i in range(len(word_list)):
+        layout = text_layouts.render(self.font, self.text, self.width - 30, self.height - 30, self.text_color)
+        if layout is not None:
+            self.lines_rect.union_ip(surface.blit(layout, (self.x + 15, self.y + 15)))
 
-            if len(current_line) + 1 + len(word_list[i]) > max_char_per_line:
-                lines.append(current_line)
-                current_line = ""  # NOTE: CHECK FOR COPYING
+    # The wrapped lines can be wider than the object itself
+    def get_rect(self):
+        return self.lines_rect.copy()
 
-            current_line += word_list[i]
-            current_line += " "
+    def is_batchable(self):
+        return True
 
-            if i == len(word_list) - 1:
-                lines.append(current_line)
-                break
 
-        for i in range(len(lines)):
-            self.text_surf = self.font.render(lines[i], True, self.text_color)
-            surface.blit(self.text_surf, (self.x + 15, self.y + 15 + i * (self.height - 30) // len(lines)))
+# ----------------- The Click Particles -----------------
+# The text that rises and fades out when you click the earth (+0.2 pollution cleared).
+# Every particle lives in a fixed size ring of arrays, so clicking as fast as possible never uses more memory.
+# All particles rise and fade at the same speed, so the oldest one always finishes first,
+# and when the ring is full the oldest particle is reused for the new one.
+# Each label is only rendered once for each level of alpha, and shared by all the particles at that alpha.
+class ClickParticles(Object):
+    # Alpha is rounded to a multiple of this, so there are only a few surfaces for each label
+    ALPHA_STEP = 8
 
+    def __init__(self, capacity, text_color, text_size=20):
+        super().__init__((0, 0, 0, 0))
 
-# ----------------- The Animated Text Object -----------------
-# (extends RectTextObject)
-# The text that appears when you click the earth (+1 pollution cleared
-class AnimatedText(RectTextObject):
-    # +1 pollution cleared
-    def __init__(self, color, rect, border, radius, text='', text_color=(0, 0, 0, 255), text_size=20):
-        super().__init__(color, rect, border, radius, text, text_color, text_size)
+        self.capacity = capacity
+        self.text_color = text_color
+        self.text_size = text_size
+        self.font = resources.font(FONT_FILE, text_size)
+
+        # The center, alpha, and label of each particle
+        self.xs = array("d", [0]) * capacity
+        self.ys = array("d", [0]) * capacity
+        self.alphas = array("d", [0]) * capacity
+        self.labels = [None] * capacity
+
+        # Particles from first up to, but not including, first + count (wrapping around) are alive
+        self.first = 0
+        self.count = 0
+
+        self.label_surfaces = {}
+        self.drawn_rect = pygame.Rect(0, 0, 0, 0)
+        self.moves = 0
+
+    def spawn(self, x, y, label):
+        if self.count == self.capacity:
+            self.first = (self.first + 1) % self.capacity
+            self.count -= 1
+
+        index = (self.first + self.count) % self.capacity
+        self.xs[index] = x
+        self.ys[index] = y
+        self.alphas[index] = 255
+        self.labels[index] = label
+        self.count += 1
+
+    def get_label_surface(self, label, alpha):
+        alpha = min(255, round(alpha / self.ALPHA_STEP) * self.ALPHA_STEP)
+
+        label_surface = self.label_surfaces.get((label, alpha))
+        if label_surface is None:
+            label_surface = self.font.render(label, True, self.text_color)
+            label_surface.set_alpha(alpha)
+            self.label_surfaces[(label, alpha)] = label_surface
+
+        return label_surface
 
     def draw(self, surface, selected):
-        self.text_surf = self.font.render(self.text, True, self.text_color)
-        self.text_surf.set_alpha(self.text_color[3])
-        surface.blit(self.text_surf, (self.x + (self.width / 2 - self.text_surf.get_width() / 2),
-                                      self.y + (self.height / 2 - self.text_surf.get_height() / 2)))
+        rects = []
+        for i in range(self.count):
+            index = (self.first + i) % self.capacity
 
-    # rise and fade out
-    def move(self):
-        self.y -= 3
-        self.text_color = (self.text_color[0], self.text_color[1], self.text_color[2], self.text_color[3]-6)
-        if self.y <= 0 or self.text_color[3] <= 0:
-            return True
-        return False
+            label_surface = self.get_label_surface(self.labels[index], self.alphas[index])
+            rects.append(surface.blit(label_surface, (self.xs[index] - label_surface.get_width() / 2,
+                                                      self.ys[index] - label_surface.get_height() / 2)))
+
+        if rects:
+            self.drawn_rect = rects[0].unionall(rects)
+
+    # Rise and fade out.
+    # Frames is how many frames at 60 FPS have passed since the last move
+    def move(self, frames=1):
+        for i in range(self.count):
+            index = (self.first + i) % self.capacity
+            self.ys[index] -= 3 * frames
+            self.alphas[index] = max(0, self.alphas[index] - 6 * frames)
+
+        # Particles that faded out or left the screen are finished
+        while self.count > 0 and (self.alphas[self.first] <= 0 or self.ys[self.first] <= 0):
+            self.labels[self.first] = None
+            self.first = (self.first + 1) % self.capacity
+            self.count -= 1
+
+        self.moves += 1
+
+    # Once every particle is gone, this is where the last ones were drawn
+    def get_rect(self):
+        return self.drawn_rect.copy()
+
+    def get_draw_state(self, selected):
+        if self.count == 0:
+            return None
+        return self.moves, self.count
+
+    def is_batchable(self):
+        return True
 
 
 # ----------------- The Rectangular Text Button -----------------
@@ -173,15 +675,12 @@ class RectTextButton(RectTextObject):
                          (self.x, self.y, self.width, self.height), self.border, self.radius)
 
         if self.text != '':
-            self.text_surf = self.font.render(self.text, True, self.text_color)
+            self.text_surf = self.render_text(self.text, self.text_color)
             surface.blit(self.text_surf, (self.x + (self.width / 2 - self.text_surf.get_width() / 2),
                                           self.y + (self.height / 2 - self.text_surf.get_height() / 2)))
 
         if selected:
-            new_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            new_surface.set_alpha(40)
-            new_surface.fill((0, 0, 0))
-            surface.blit(new_surface, (self.x, self.y))
+            surface.blit(resources.shade((self.width, self.height), 40), (self.x, self.y))
 
     def is_selecting(self, mouse_pos):
         if self.x < mouse_pos[0] < self.x + self.width and \
@@ -200,20 +699,17 @@ class ImageButton(RectTextButton):
     # e.g. sell button. Buttons with images
     def __init__(self, color, rect, border, radius, action, image_file, text='', text_color=(0, 0, 0), text_size=10):
         super().__init__(color, rect, border, radius, action, text, text_color, text_size)
-        self.image = pygame.image.load(image_file).convert_alpha()
+        self.image = resources.image(image_file)
 
     def draw(self, surface, selected):
         surface.blit(self.image, (self.x, self.y))
 
-        self.text_surf = self.font.render(self.text, True, self.text_color)
+        self.text_surf = self.render_text(self.text, self.text_color)
         surface.blit(self.text_surf, (self.x + (self.width / 2 - self.text_surf.get_width() / 2),
                                       self.y + (self.height / 2 - self.text_surf.get_height() / 2)))
 
         if selected:
-            new_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            new_surface.set_alpha(40)
-            new_surface.fill((0, 0, 0))
-            surface.blit(new_surface, (self.x, self.y))
+            surface.blit(resources.shade((self.width, self.height), 40), (self.x, self.y))
 
     def is_selecting(self, mouse_pos):
         if self.x < mouse_pos[0] < self.x + self.width and \
@@ -224,6 +720,12 @@ class ImageButton(RectTextButton):
     def get_action(self):
         return self.action
 
+    def get_rect(self):
+        return super().get_rect().union(self.image.get_rect(topleft=(self.x, self.y)))
+
+    def is_batchable(self):
+        return True
+
 
 # ----------------- The Item -----------------
 # Every object or machine that you purchase
@@ -236,49 +738,67 @@ class Item(RectTextButton):
         self.hidden = True
         self.enough = False
         self.item_type = item_type
-        self.image = pygame.image.load(base_path + "images/building_frame.png").convert_alpha()
-        self.item_icon = pygame.image.load(base_path + "images/item_icons/item_icon{0}.png".format(item_type))
+        self.image = resources.image(base_path + "images/building_frame.png")
+        self.item_icon = resources.image(base_path + "images/item_icons/item_icon{0}.png".format(item_type), None)
 
+        # Copied from the GameState before drawing
+        # The price is for buying amount items at once
         self.price = ITEM_PRICES[item_type]
+        self.amount = 1
         self.text = ITEM_NAMES[item_type]
-        self.rate = ITEM_RATES[item_type]
         self.count = 0
-        self.multiplier = 1
+
+        # The price and count text, only formatted again when what they show changes
+        self.formatted_price = None
+        self.formatted_amount = None
+        self.money_text = ""
+        self.formatted_count = None
+        self.count_text = ""
+
+        self.count_rect = None
 
     # Draws the rectangle on the right side of the screen
     def draw(self, surface, selected):
         surface.blit(self.image, (self.x, self.y))
+        self.count_rect = None
 
         # Only show the actual Item if it is not hidden
         if not self.hidden:
             surface.blit(self.item_icon, (self.x+10, self.y + (self.height / 2 - 100 / 2)))
-            self.text_surf = self.font.render(self.text, True, self.text_color)
+            self.text_surf = self.render_text(self.text, self.text_color)
             surface.blit(self.text_surf, (self.x + 35 + (self.width / 2 - self.text_surf.get_width() / 2),
                                           self.y - 20 + (self.height / 2 - self.text_surf.get_height() / 2)))
 
-            money_font = pygame.font.Font('fonts/HackbotFreeTrial-8MgA2.otf',
-                                          24)
-            money_text_surf = money_font.render("$: " + str(self.price), True, MONEY_COLOR)
+            self.update_texts()
+
+            money_text_surf = text_cache.render(self.font_file, 24, self.money_text, MONEY_COLOR)
             surface.blit(money_text_surf, (self.x + 35 + (self.width / 2 - money_text_surf.get_width() / 2),
                                           self.y + 20 + (self.height / 2 - money_text_surf.get_height() / 2)))
 
-            count_font = pygame.font.Font('fonts/HackbotFreeTrial-8MgA2.otf',
-                                          35)
-            count_text_surf = count_font.render(str(self.count), True, COUNT_COLOR)
-            surface.blit(count_text_surf, (self.x + 150 + (self.width / 2 - count_text_surf.get_width() / 2),
-                                          self.y + 10 + (self.height / 2 - count_text_surf.get_height() / 2)))
+            count_text_surf = text_cache.render(self.font_file, 35, self.count_text, COUNT_COLOR)
+            self.count_rect = surface.blit(count_text_surf,
+                                           (self.x + 150 + (self.width / 2 - count_text_surf.get_width() / 2),
+                                            self.y + 10 + (self.height / 2 - count_text_surf.get_height() / 2)))
 
         # Visibility code for when the upgrade is selected or not able to be bought
         if selected:
-            new_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            new_surface.set_alpha(40)
-            new_surface.fill((0, 0, 0))
-            surface.blit(new_surface, (self.x, self.y))
+            surface.blit(resources.shade((self.width, self.height), 40), (self.x, self.y))
         if not self.enough:
-            new_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            new_surface.set_alpha(200)
-            new_surface.fill((0, 0, 0))
-            surface.blit(new_surface, (self.x, self.y))
+            surface.blit(resources.shade((self.width, self.height), 200), (self.x, self.y))
+
+    # Bulk prices can have hundreds of digits, so they are shortened like the HUD numbers.
+    # Prices under a thousand have no suffix, so the space that stands in for one is left off
+    def update_texts(self):
+        if self.formatted_price != self.price or self.formatted_amount != self.amount:
+            self.formatted_price = self.price
+            self.formatted_amount = self.amount
+            self.money_text = "$: " + BigNumber(self.price).format().rstrip()
+            if self.amount != 1:
+                self.money_text += " (x{})".format(self.amount)
+
+        if self.formatted_count != self.count:
+            self.formatted_count = self.count
+            self.count_text = str(self.count)
 
     def is_selecting(self, mouse_pos):
         if self.x < mouse_pos[0] < self.x + self.width and \
@@ -289,6 +809,19 @@ class Item(RectTextButton):
     def get_action(self):
         return self.action
 
+    # Large counts can reach past the right side of the frame
+    def get_rect(self):
+        rect = Object.get_rect(self)
+        if self.count_rect is not None:
+            rect.union_ip(self.count_rect)
+        return rect
+
+    def get_draw_state(self, selected):
+        return super().get_draw_state(selected) + (self.hidden, self.enough, self.price, self.amount, self.count)
+
+    def is_batchable(self):
+        return True
+
 
 # ----------------- The Scroll Bar -----------------
 # (extends ImageButton)
@@ -310,48 +843,47 @@ class ScrollBar(ImageButton):
 class ItemPopup(ImageRectTextObject):
     # self, color, rect, border, radius, image_file, text='', text_color=(0, 0, 0), text_size=10
     def __init__(self, color, rect, border, radius, machine_image, popup_message="Lorem Ipsum"):
-        super().__init__(color, rect, border, radius, machine_image, text=popup_message, text_color=(250, 250, 250),
-                         text_size=15)
-
-    def draw(self, surface, selected):
-        surface.blit(self.image, (self.x, self.y))
+        # The text is wrapped when the popup is rendered, so it is not rendered as one long line here
+        super().__init__(color, rect, border, radius, machine_image, text_color=(250, 250, 250), text_size=15)
+        self.text = popup_message
+        self.lines_rect = Object.get_rect(self)
 
-        # ----------------- Code used for wrapping text and formatting -----------------
+        # The whole popup is rendered once onto its own surface, which is kept until the text changes
+        self.rendered_text = None
+        self.rendered_surface = None
+        self.rendered_offset = (0, 0)
 
-        popup_width = 390
-        popup_height = 100
+    def draw(self, surface, selected):
+        if self.rendered_text != self.text:
+            self.render_popup()
 
-        # Calculate each line
-        max_char_per_line = int(1.95 * (popup_width - 30)) // self.text_size
-        word_list = self.text.split()
-        lines = []
-        current_line = ""
+        self.lines_rect = surface.blit(self.rendered_surface,
+                                       (self.x + self.rendered_offset[0], self.y + self.rendered_offset[1]))
 
-        # Place each formatted line into an array that will be processed
-        for i in range(len(word_list)):
+    # Renders the frame and the wrapped text, relative to the top left corner of the popup.
+    # The name of the item before the ":" is highlighted
+    def render_popup(self):
+        blits = [(self.image, (0, 0))]
 
-            if len(current_line) + 1 + len(word_list[i]) > max_char_per_line:
-                lines.append(current_line)
-                current_line = ""  # NOTE: CHECK FOR COPYING
+        layout = text_layouts.render(self.font, self.text, self.width - 30, self.height - 30, self.text_color,
+                                     highlight_color=(0, 240, 0))
+        if layout is not None:
+            blits.append((layout, (15, 15)))
 
-            current_line += word_list[i]
-            current_line += " "
+        # The wrapped lines can be wider than the popup itself
+        area = self.image.get_rect().unionall([text_surf.get_rect(topleft=position) for text_surf, position in blits])
 
-            if i == len(word_list) - 1:
-                lines.append(current_line)
-                break
+        self.rendered_surface = pygame.Surface(area.size, pygame.SRCALPHA)
+        for text_surf, position in blits:
+            self.rendered_surface.blit(text_surf, (position[0] - area.x, position[1] - area.y))
 
-        first_line = lines[0].split(":")
-        name_highlight = first_line[0] + ":"
-        self.text_surf = self.font.render(name_highlight, True, (0, 240, 0))
-        surface.blit(self.text_surf, (self.x + 15, self.y + 15))
-        self.text_surf = self.font.render(first_line[1], True, self.text_color)
-        surface.blit(self.text_surf, (self.x + 15 + (len(name_highlight) / 1.8 * self.text_size), self.y + 15))
+        self.rendered_offset = area.topleft
+        self.rendered_text = self.text
 
-        # Place each line of text
-        for i in range(1, len(lines)):
-            self.text_surf = self.font.render(lines[i], True, self.text_color)
-            surface.blit(self.text_surf, (self.x + 15, self.y + 15 + i * (popup_height - 30) // len(lines)))
+    # The wrapped lines can be wider than the popup itself.
+    # text_surf is never drawn, so the rect of RectTextObject would be the wrong size
+    def get_rect(self):
+        return Object.get_rect(self).union(self.lines_rect)
 
 
 # ----------------- Upgrade Class -----------------
@@ -367,20 +899,14 @@ class Upgrade(ImageButton):
         self.tier = item[1]
 
         self.price = UPGRADE_COSTS[self.item_type][self.tier]
-        self.affected_items = UPGRADE_ACTIONS[self.item_type]
-        self.affected_rates = UPGRADE_RATES[self.item_type][self.tier]
         self.hidden = False
         self.purchased = False
         self.enough = False
 
-        self.icon = pygame.image.load(
-            base_path+"images/upgrade_icons/upgrade_icon{0}_{1}.png".format(self.item_type, self.tier)).convert_alpha()
+        self.icon = resources.image(
+            base_path+"images/upgrade_icons/upgrade_icon{0}_{1}.png".format(self.item_type, self.tier))
 
-        self.upgrade_order = 0
-        for i in range(len(UPGRADE_ORDER)):
-            if self.item_type == UPGRADE_ORDER[i][0] and self.tier == UPGRADE_ORDER[i][1]:
-                self.upgrade_order = i
-                break
+        self.upgrade_order = UPGRADE_ORDER_INDEX[(self.item_type, self.tier)]
 
     # Draw the Upgrades
     def draw(self, surface, selected):
@@ -392,36 +918,63 @@ class Upgrade(ImageButton):
 
         # Visibility code for when the upgrade is selected or not able to be bought
         if selected:
-            new_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            new_surface.set_alpha(40)
-            new_surface.fill((0, 0, 0))
-            surface.blit(new_surface, (self.x, self.y))
+            surface.blit(resources.shade((self.width, self.height), 40), (self.x, self.y))
         if not self.enough:
-            new_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            new_surface.set_alpha(200)
-            new_surface.fill((0, 0, 0))
-            surface.blit(new_surface, (self.x, self.y))
+            surface.blit(resources.shade((self.width, self.height), 200), (self.x, self.y))
 
-    # Move the upgrades based on order and price
+    # Move the upgrades based on order and price.
+    # Returns whether the upgrade moved
     def move(self, new_order):
-        if self.hidden:
-            return
-
         row = new_order // 4
         col = new_order % 4
-        self.x = 4 + col * self.width
-        self.y = LAYER_UPGRADE_TITLE_RECT[1] + LAYER_UPGRADE_TITLE_RECT[3] - 4 + row * self.height
+        x = 4 + col * self.width
+        y = LAYER_UPGRADE_TITLE_RECT[1] + LAYER_UPGRADE_TITLE_RECT[3] - 4 + row * self.height
+
+        moved = (x, y) != (self.x, self.y)
+        self.x = x
+        self.y = y
+
+        return moved
+
+    def get_draw_state(self, selected):
+        return super().get_draw_state(selected) + (self.hidden, self.enough)
 
 
 # ----------------- Upgrade Popup Class -----------------
 # The popup that appears when you hover over an upgrade
 class UpgradePopup(ItemPopup):
     def __init__(self, color, rect, border, radius, machine_image, price, popup_message="Lorem Ipsum"):
-        super().__init__(color, rect, border, radius, machine_image, popup_message)
-        self.text = popup_message + " $:.." + str(price)
+        super().__init__(color, rect, border, radius, machine_image, popup_message + " $:.." + str(price))
 
-    def draw(self, surface, selected):
-        super().draw(surface, selected)
+
+# ----------------- The Earth Frame Cache -----------------
+# (extends LRUCache)
+# Decodes each earth stage image once, and remembers the scaled frames keyed by (stage, width, height).
+# Only the most recently used frames are kept, so the sizes in between animations cannot grow it forever.
+class EarthFrameCache(LRUCache):
+    def __init__(self, max_frames=64):
+        super().__init__(max_frames)
+
+    def get_frame(self, stage, width, height):
+        return self.get((stage, width, height), self.scale_frame, stage, width, height)
+
+    def scale_frame(self, stage, width, height):
+        unedited_sprite = resources.image(base_path + "images/earth_clickers/earth{}.png".format(stage))
+        return pygame.transform.smoothscale(unedited_sprite, (width, height))
+
+
+# The shared earth frames used by every Earth
+earth_frames = EarthFrameCache()
+
+
+# ----------------- Clearing the Caches -----------------
+# The shared caches keep fonts and surfaces, which can not be used once pygame quits.
+# This is called before pygame quits, so another game can be started in the same process
+def clear_caches():
+    resources.clear()
+    text_cache.clear()
+    text_layouts.clear()
+    earth_frames.clear()
 
 
 # ----------------- The Earth Clicker -----------------
@@ -434,42 +987,37 @@ class Earth(pygame.sprite.Sprite):
 
         self.max_animation_frames = 10
         self.animation_frame = self.max_animation_frames
+        self.animation_time = 0  # Seconds the animation is behind by
         self.x = rect[0]
         self.y = rect[1]
         self.width = rect[2]
         self.height = rect[3]
         self.current_rect = rect
 
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        self.rect = self.image.get_rect()
-        self.rect.topleft = [self.x, self.y]
-
         self.stage = 0
+        self.drawn_frame = None
 
-        self.unedited_sprite = pygame.image.load(base_path + "images/earth_clickers/earth0.png")
-        self.sprite = pygame.transform.smoothscale(
-            self.unedited_sprite,
-            (self.width, self.height))
+        self.image = None
+        self.rect = None
+        self.redraw()
 
-        self.image.blit(self.sprite, (0, 0))
-    
     # Draws the earth, depending on how clean it is
+    # The frame only changes when the stage or the size of the earth changes
     def redraw(self):
+        frame = (min(4, self.stage), int(self.width), int(self.height))
 
-        self.unedited_sprite = pygame.image.load(
-            base_path + "images/earth_clickers/earth{}.png".format(min(4, self.stage)))
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        self.image.convert_alpha()
+        if frame != self.drawn_frame:
+            self.drawn_frame = frame
+            self.image = earth_frames.get_frame(*frame)
+            self.rect = self.image.get_rect()
 
-        self.rect = self.image.get_rect()
         self.rect.topleft = [self.x, self.y]
 
-        self.sprite = pygame.transform.smoothscale(
-            self.unedited_sprite,
-            (self.width, self.height))
+    def set_stage(self, stage):
+        if stage != self.stage:
+            self.stage = stage
+            self.redraw()
 
-        self.image.blit(self.sprite, (0, 0))
-    
     # ----------------- Clicking animations -----------------
     # Scale the earth down
     def resize_down(self):
@@ -485,25 +1033,30 @@ class Earth(pygame.sprite.Sprite):
         self.animation_frame = 0
         self.current_rect = EARTH_CLICKER_LARGE_RECT
 
-    def animate(self):
+    # Animation frames are stepped at 60 FPS, no matter how fast the game is drawn
+    def animate(self, dt):
         if self.animation_frame == self.max_animation_frames:
+            self.animation_time = 0
             return
 
-        self.animation_frame += 1
+        self.animation_time += dt
+        while self.animation_time >= ANIMATION_FRAME_TIME and self.animation_frame < self.max_animation_frames:
+            self.animation_time -= ANIMATION_FRAME_TIME
+            self.animation_frame += 1
 
-        deltas = (self.current_rect[0] - self.x,
-                  self.current_rect[1] - self.y,
-                  self.current_rect[2] - self.width,
-                  self.current_rect[3] - self.height)
+            deltas = (self.current_rect[0] - self.x,
+                      self.current_rect[1] - self.y,
+                      self.current_rect[2] - self.width,
+                      self.current_rect[3] - self.height)
 
-        adjusted_deltas = []
-        for d in deltas:
-            adjusted_deltas.append(d * (self.animation_frame / self.max_animation_frames))
+            adjusted_deltas = []
+            for d in deltas:
+                adjusted_deltas.append(d * (self.animation_frame / self.max_animation_frames))
 
-        self.x += adjusted_deltas[0]
-        self.y += adjusted_deltas[1]
-        self.width += adjusted_deltas[2]
-        self.height += adjusted_deltas[3]
+            self.x += adjusted_deltas[0]
+            self.y += adjusted_deltas[1]
+            self.width += adjusted_deltas[2]
+            self.height += adjusted_deltas[3]
 
         self.redraw()
 
@@ -513,19 +1066,27 @@ class Earth(pygame.sprite.Sprite):
 
         return center
 
+    # Compares squared distances, so no square root is needed
     def colliding(self, location):
         radius = self.width // 2
         center = self.get_center()
 
-        x_leg = abs(location[0] - center[0])
-        y_leg = abs(location[1] - center[1])
+        x_leg = location[0] - center[0]
+        y_leg = location[1] - center[1]
 
-        hyp = (x_leg ** 2 + y_leg ** 2) ** 0.5
+        return x_leg * x_leg + y_leg * y_leg <= radius * radius
 
-        if hyp <= radius:
-            return True
-        else:
-            return False
+    def draw(self, surface, selected):
+        surface.blit(self.image, self.rect)
+
+    def get_rect(self):
+        return self.rect.copy()
+
+    def is_batchable(self):
+        return True
+
+    def get_draw_state(self, selected):
+        return self.drawn_frame, self.rect.topleft
 
 
 # (extends CircleObject)
@@ -544,9 +1105,10 @@ class Star(CircleObject):
                          (self.x, self.y), 0, self.radius)
         self.center = (self.x, self.y)
 
-    def update_position(self, displacement):
-        displacement = (displacement[0] + self.inherent_speed,
-                        displacement[1] + self.inherent_speed)
+    # Frames is how many frames at 60 FPS have passed since the last update
+    def update_position(self, displacement, frames=1):
+        displacement = ((displacement[0] + self.inherent_speed) * frames,
+                        (displacement[1] + self.inherent_speed) * frames)
 
         self.x += displacement[0]
         self.y += displacement[1]
@@ -571,15 +1133,207 @@ class Star(CircleObject):
 
         self.center = (self.x, self.y)
 
-    def draw(self, surface, selected):
-        super().draw(surface, selected)
-        self.twinkle_frame_counter += 1
+        # Twinkle
+        self.twinkle_frame_counter += frames
 
-        if self.twinkle_frame_counter == self.twinkle_frame_gap:
-            self.radius = 2
-        elif self.twinkle_frame_counter == self.twinkle_frame_gap + 20:
+        if self.twinkle_frame_counter >= self.twinkle_frame_gap + 20:
             self.radius = 1
             self.twinkle_frame_counter = 0
             self.twinkle_frame_gap = random.randint(120, 500)
+        elif self.twinkle_frame_counter >= self.twinkle_frame_gap:
+            self.radius = 2
+
+    def draw(self, surface, selected):
+        super().draw(surface, selected)
+
+
+# ----------------- The Star Field -----------------
+# (extends Object)
+# Every star from a spawn rect, kept in NumPy arrays instead of separate Star objects.
+# The stars all move, respawn, and twinkle at once, and are drawn by writing straight into the surface's pixels.
+class StarField(Object):
+
+    # The pixels pygame.draw.circle fills for a star of radius 1 and radius 2
+    STAR_PIXELS = {
+        1: ((-1, -1), (-1, 0), (0, -1), (0, 0)),
+        2: ((-2, -1), (-2, 0), (-1, -2), (-1, -1), (-1, 0), (-1, 1),
+            (0, -2), (0, -1), (0, 0), (0, 1), (1, -1), (1, 0)),
+    }
+
+    def __init__(self, spawn_rect, num_stars):
+        super().__init__(spawn_rect)
+        self.spawn_rect = spawn_rect
+        self.num_stars = num_stars
+        self.random = numpy.random.default_rng()
+
+        self.xs = self.random.integers(self.x, self.x + self.width - 1, num_stars, endpoint=True).astype(float)
+        self.ys = self.random.integers(self.y, self.y + self.height - 1, num_stars, endpoint=True).astype(float)
+        self.inherent_speeds = self.random_speeds(num_stars)
+
+        self.colors = self.random.integers(200, 255, (num_stars, 3), endpoint=True)
+        self.mapped_colors = None
+        self.mapped_format = None
+
+        self.radii = numpy.ones(num_stars, dtype=int)
+        self.twinkle_frame_gaps = self.random.integers(120, 500, num_stars, endpoint=True)
+        self.twinkle_frame_counters = numpy.zeros(num_stars)
+        self.frame = 0
+
+    def random_speeds(self, count):
+        return self.random.integers(-5, 5, count, endpoint=True) / 100.0
+
+    # Frames is how many frames at 60 FPS have passed since the last update
+    def update_position(self, displacement, frames=1):
+        self.xs += (displacement[0] + self.inherent_speeds) * frames
+        self.ys += (displacement[1] + self.inherent_speeds) * frames
+
+        # Out of bounds, checked in the same order as Star.update_position
+        left = self.xs < self.x
+        right = ~left & (self.xs > self.x + self.width)
+        top = ~(left | right) & (self.ys < self.y)
+        bottom = ~(left | right | top) & (self.ys > self.y + self.height)
+
+        self.respawn(left, self.x + self.width, None)
+        self.respawn(right, self.x, None)
+        self.respawn(top, None, self.y + self.height)
+        self.respawn(bottom, None, self.y)
+
+        # Twinkle
+        self.twinkle_frame_counters += frames
+
+        shrinking = self.twinkle_frame_counters >= self.twinkle_frame_gaps + 20
+        growing = ~shrinking & (self.twinkle_frame_counters >= self.twinkle_frame_gaps)
+
+        self.radii[growing] = 2
+        self.radii[shrinking] = 1
+        self.twinkle_frame_counters[shrinking] = 0
+        self.twinkle_frame_gaps[shrinking] = self.random.integers(120, 500, numpy.count_nonzero(shrinking),
+                                                                  endpoint=True)
+
+    # Move the stars in the mask to a new edge position with a new speed
+    def respawn(self, mask, x, y):
+        count = numpy.count_nonzero(mask)
+        if count == 0:
+            return
+
+        self.inherent_speeds[mask] = self.random_speeds(count)
+
+        if x is None:
+            self.xs[mask] = self.random.integers(self.x, self.x + self.width - 1, count, endpoint=True)
+        else:
+            self.xs[mask] = x
+
+        if y is None:
+            self.ys[mask] = self.random.integers(self.y, self.y + self.height - 1, count, endpoint=True)
+        else:
+            self.ys[mask] = y
 
+    def draw(self, surface, selected):
+        try:
+            pixels = pygame.surfarray.pixels2d(surface)
+        except ValueError:
+            self.draw_circles(surface)
+        else:
+            self.draw_pixels(surface, pixels)
+            del pixels
+
+        self.frame += 1
+
+    def draw_pixels(self, surface, pixels):
+        surface_format = (surface.get_bitsize(), surface.get_masks())
+        if surface_format != self.mapped_format:
+            self.mapped_colors = numpy.array([surface.map_rgb(tuple(color)) for color in self.colors],
+                                             dtype=pixels.dtype)
+            self.mapped_format = surface_format
+
+        clip = surface.get_clip()
+        xs = self.xs.astype(int)
+        ys = self.ys.astype(int)
+
+        for radius, offsets in self.STAR_PIXELS.items():
+            stars = self.radii == radius
+            star_xs = xs[stars]
+            star_ys = ys[stars]
+            star_colors = self.mapped_colors[stars]
+
+            for offset in offsets:
+                pixel_xs = star_xs + offset[0]
+                pixel_ys = star_ys + offset[1]
+                inside = (pixel_xs >= clip.left) & (pixel_xs < clip.right) & \
+                         (pixel_ys >= clip.top) & (pixel_ys < clip.bottom)
+
+                pixels[pixel_xs[inside], pixel_ys[inside]] = star_colors[inside]
+
+    # Used for surfaces whose pixels cannot be written to directly
+    def draw_circles(self, surface):
+        for i in range(self.num_stars):
+            pygame.draw.circle(surface, tuple(self.colors[i]), (self.xs[i], self.ys[i]), int(self.radii[i]), 0)
+
+    def get_rect(self):
+        return pygame.Rect(self.spawn_rect).inflate(4, 4)
+
+    # The stars move every frame
+    def get_draw_state(self, selected):
+        return self.frame
+
+
+# Create the stars for a spawn rect.
+# All of them are kept in one StarField if NumPy is installed, otherwise each one is a separate Star
+def create_stars(spawn_rect, num_stars):
+    if numpy is not None:
+        return [StarField(spawn_rect, num_stars)]
+
+    stars = []
+    for star_i in range(num_stars):
+        stars.append(Star(spawn_rect))
+
+    return stars
+
+
+# ----------------- The Profiler Overlay -----------------
+# Shows the rolling p50 and p99 of every phase measured by a FrameProfiler, in the top left corner.
+# Sorting the timings takes a while, so the text is only updated every few frames
+class ProfilerOverlay(Object):
+    def __init__(self, position, text_size=14, update_interval=30):
+        super().__init__((position[0], position[1], 0, 0))
+
+        self.font = resources.font(FONT_FILE, text_size)
+        self.update_interval = update_interval
+        self.frames_until_update = 0
+
+        self.lines = ()
+        self.surface = None
+
+    def update(self, profiler):
+        self.frames_until_update -= 1
+        if self.frames_until_update > 0:
+            return
+        self.frames_until_update = self.update_interval
+
+        # The font has no underscores, so the phase names are shown with spaces
+        rows = [("phase", "p50 ms", "p99 ms")]
+        for phase, p50, p99 in profiler.get_percentiles():
+            rows.append((phase.replace("_", " "), "{:.2f}".format(p50), "{:.2f}".format(p99)))
+        self.lines = tuple(rows)
+
+        # Each column is as wide as its widest cell, and the numbers are right aligned
+        cells = [[self.font.render(cell, True, (255, 255, 255)) for cell in row] for row in rows]
+        column_widths = [max(row[column].get_width() for row in cells) for column in range(3)]
+        line_height = self.font.get_linesize()
+        self.width = sum(column_widths) + 30
+        self.height = line_height * len(cells) + 10
+
+        self.surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+        self.surface.fill((0, 0, 0, 180))
+        for i in range(len(cells)):
+            y = 5 + i * line_height
+            self.surface.blit(cells[i][0], (5, y))
+            self.surface.blit(cells[i][1], (15 + column_widths[0] + column_widths[1] - cells[i][1].get_width(), y))
+            self.surface.blit(cells[i][2], (self.width - 5 - cells[i][2].get_width(), y))
+
+    def draw(self, surface, selected):
+        if self.surface is not None:
+            surface.blit(self.surface, (self.x, self.y))
 
+    def get_draw_state(self, selected):
+        return self.lines
@@ -0,0 +1,112 @@
+import csv
+from array import array
+from time import perf_counter_ns
+
+
+'''
+This is a file containing the frame profiler, which measures how long each part of a frame takes.
+The main loop marks the end of each phase, and the time since the last mark is added to that phase.
+Every frame is kept in a ring buffer for the rolling statistics, and can also be written to a CSV file.
+While it is disabled, marking a phase only checks a flag.
+'''
+
+
+# ----------------- The Frame Profiler -----------------
+class FrameProfiler:
+    def __init__(self, capacity=600, enabled=False, csv_file=None):
+        self.capacity = capacity
+        self.enabled = enabled
+
+        # Whether the current frame is being recorded. The profiler can be turned on partway through a frame,
+        # so recording only starts with the next frame
+        self.recording = False
+
+        # The nanoseconds each phase took in each of the last capacity frames, indexed by phase name.
+        # Phases are kept in the order they were first marked
+        self.timings = {}
+        self.frames = 0  # Frames recorded so far, including the ones that have left the ring buffer
+
+        self.current = {}
+        self.last_mark = 0
+
+        self.csv_file = None
+        self.csv_writer = None
+        self.csv_phases = None
+        if csv_file is not None:
+            self.start_csv(csv_file)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled or self.csv_writer is not None
+        if not self.enabled:
+            self.recording = False
+
+    # ----------------- Marking phases -----------------
+    def begin_frame(self):
+        self.recording = self.enabled
+        if not self.recording:
+            return
+
+        self.current = {}
+        self.last_mark = perf_counter_ns()
+
+    # The time since the last mark is added to the phase
+    def mark(self, phase):
+        if not self.recording:
+            return
+
+        now = perf_counter_ns()
+        self.current[phase] = self.current.get(phase, 0) + now - self.last_mark
+        self.last_mark = now
+
+    def end_frame(self):
+        if not self.recording or not self.current:
+            return
+
+        index = self.frames % self.capacity
+        for phase in self.current:
+            if phase not in self.timings:
+                self.timings[phase] = array("q", [0]) * self.capacity
+
+        for phase, timings in self.timings.items():
+            timings[index] = self.current.get(phase, 0)
+
+        self.frames += 1
+
+        if self.csv_writer is not None:
+            self.write_csv_row()
+
+    # ----------------- Statistics -----------------
+    # Returns (phase, p50, p99) for every phase, in milliseconds, over the frames in the ring buffer
+    def get_percentiles(self):
+        recorded = min(self.frames, self.capacity)
+        if recorded == 0:
+            return []
+
+        percentiles = []
+        for phase, timings in self.timings.items():
+            ordered = sorted(timings[:recorded])
+            percentiles.append((phase, ordered[(recorded - 1) // 2] / 1e6, ordered[(recorded - 1) * 99 // 100] / 1e6))
+
+        return percentiles
+
+    # ----------------- CSV -----------------
+    # Every frame from now on is written to the CSV file, with a column for each phase in nanoseconds
+    def start_csv(self, csv_file):
+        self.csv_file = open(csv_file, "w", newline="")
+        self.csv_writer = csv.writer(self.csv_file)
+        self.enabled = True
+
+    def write_csv_row(self):
+        # The columns are the phases of the first frame written. Later phases are left out
+        if self.csv_phases is None:
+            self.csv_phases = list(self.current)
+            self.csv_writer.writerow(["frame"] + self.csv_phases + ["total"])
+
+        row = [self.current.get(phase, 0) for phase in self.csv_phases]
+        self.csv_writer.writerow([self.frames] + row + [sum(self.current.values())])
+
+    def stop(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
+            self.csv_writer = None
@@ -0,0 +1,202 @@
+import os
+import struct
+import threading
+import time
+
+from constants import *
+from big_number import BigNumber
+from engine import GameState
+
+
+'''
+This is a file containing the save format, and the autosaver that writes it in the background.
+
+A save is a fixed header followed by arrays:
+    header:  magic, version, number of items, number of upgrades,
+             last active time, money, pollution cleared, total pollution cleared, PPS, click strength, upgrade count
+    items:   counts, then prices, then multipliers, one of each per item
+    upgrades: a bitset of the purchased upgrades, in UPGRADE_ORDER
+Everything is little endian.
+
+Money, pollution cleared, total pollution cleared and PPS are BigNumbers, stored as a mantissa and an exponent.
+Version 1 saves stored them as plain floats, and can still be loaded.
+'''
+
+
+SAVE_MAGIC = b"CCSV"
+SAVE_VERSION = 2
+
+PREFIX = struct.Struct("<4sH")
+HEADER = struct.Struct("<4sHHHd" + "dq" * 4 + "dI")
+HEADER_V1 = struct.Struct("<4sHHH6dI")
+
+
+# ----------------- Packing -----------------
+# Turn the game state into the bytes of a save
+def pack_state(state):
+    num_items = len(state.item_counts)
+    num_upgrades = len(state.upgrades_purchased)
+
+    header = HEADER.pack(SAVE_MAGIC, SAVE_VERSION, num_items, num_upgrades, state.last_active_time,
+                         state.money.mantissa, state.money.exponent,
+                         state.pollution_cleared.mantissa, state.pollution_cleared.exponent,
+                         state.total_pollution_cleared.mantissa, state.total_pollution_cleared.exponent,
+                         state.pps.mantissa, state.pps.exponent,
+                         state.click_strength, state.upgrade_count)
+    items = struct.pack("<{0}q{0}d{0}d".format(num_items),
+                        *state.item_counts, *state.item_prices, *state.item_multipliers)
+
+    upgrades = bytearray((num_upgrades + 7) // 8)
+    for upgrade_order in range(num_upgrades):
+        if state.upgrades_purchased[upgrade_order]:
+            upgrades[upgrade_order // 8] |= 1 << (upgrade_order % 8)
+
+    return header + items + bytes(upgrades)
+
+
+# Turn the bytes of a save back into a game state
+def unpack_state(data):
+    magic, version = PREFIX.unpack_from(data)
+
+    if magic != SAVE_MAGIC:
+        raise ValueError("Not a Carbon Clicker save")
+
+    if version == SAVE_VERSION:
+        header_size = HEADER.size
+        _, _, num_items, num_upgrades, last_active_time, money_mantissa, money_exponent, \
+            pollution_cleared_mantissa, pollution_cleared_exponent, \
+            total_pollution_cleared_mantissa, total_pollution_cleared_exponent, \
+            pps_mantissa, pps_exponent, click_strength, upgrade_count = HEADER.unpack_from(data)
+
+        money = BigNumber.make(money_mantissa, money_exponent)
+        pollution_cleared = BigNumber.make(pollution_cleared_mantissa, pollution_cleared_exponent)
+        total_pollution_cleared = BigNumber.make(total_pollution_cleared_mantissa, total_pollution_cleared_exponent)
+        pps = BigNumber.make(pps_mantissa, pps_exponent)
+    elif version == 1:
+        header_size = HEADER_V1.size
+        _, _, num_items, num_upgrades, last_active_time, money, pollution_cleared, \
+            total_pollution_cleared, pps, click_strength, upgrade_count = HEADER_V1.unpack_from(data)
+
+        money = BigNumber(money)
+        pollution_cleared = BigNumber(pollution_cleared)
+        total_pollution_cleared = BigNumber(total_pollution_cleared)
+        pps = BigNumber(pps)
+    else:
+        raise ValueError("Unsupported save version {}".format(version))
+
+    if num_items != NUM_ITEMS or num_upgrades != len(UPGRADE_ORDER):
+        raise ValueError("The save does not match the items and upgrades of this game")
+
+    items = struct.unpack_from("<{0}q{0}d{0}d".format(num_items), data, header_size)
+    upgrades = data[header_size + num_items * 24:]
+
+    state = GameState()
+    state.last_active_time = last_active_time
+    state.money = money
+    state.pollution_cleared = pollution_cleared
+    state.total_pollution_cleared = total_pollution_cleared
+    state.previous_pollution_cleared = pollution_cleared
+    state.pps = pps
+    state.click_strength = click_strength
+
+    state.item_counts = list(items[:num_items])
+    state.item_prices = list(items[num_items:num_items * 2])
+    state.item_multipliers = list(items[num_items * 2:])
+    state.recalculate_rates()
+
+    # Upgrades are shown once they have been unlocked, until they are purchased
+    state.upgrade_count = upgrade_count
+    state.upgrades_purchased = [bool(upgrades[i // 8] & (1 << (i % 8))) for i in range(num_upgrades)]
+    state.upgrades_shown = [i for i in range(upgrade_count + 1) if not state.upgrades_purchased[i]]
+
+    return state
+
+
+# ----------------- Files -----------------
+# Write the save to a temporary file first, and then rename it,
+# so the save file is never left half written
+def write_save(save_file, data):
+    temporary_file = save_file + ".tmp"
+    with open(temporary_file, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temporary_file, save_file)
+
+
+# Returns the loaded game state and the seconds it took to load,
+# or None and 0 if there is no save, or it can not be read.
+# A save that can not be unpacked is moved aside, so the game can start over without losing it
+def load_game(save_file):
+    start = time.perf_counter()
+
+    try:
+        with open(save_file, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None, 0
+    except OSError as error:
+        print("The save could not be read: {}".format(error))
+        return None, 0
+
+    try:
+        state = unpack_state(data)
+    except (struct.error, ValueError, IndexError) as error:
+        bad_file = save_file + ".bad"
+        try:
+            os.replace(save_file, bad_file)
+            print("The save could not be loaded ({}), so it was moved to {}".format(error, bad_file))
+        except OSError:
+            print("The save could not be loaded ({}), and could not be moved aside".format(error))
+        return None, 0
+
+    return state, time.perf_counter() - start
+
+
+# ----------------- The Autosaver -----------------
+# Writes saves on a background thread, so the game never waits on the disk.
+# Only the newest save is kept if the thread falls behind.
+class AutoSaver:
+    def __init__(self, save_file):
+        self.save_file = save_file
+
+        self.pending = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = True
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Packing is quick, so it is done right away to get a consistent copy of the state
+    def save(self, state):
+        data = pack_state(state)
+        with self.lock:
+            self.pending = data
+        self.wake.set()
+
+    def run(self):
+        while self.running:
+            self.wake.wait()
+            self.wake.clear()
+            self.write_pending()
+
+    def write_pending(self):
+        with self.lock:
+            data = self.pending
+            self.pending = None
+
+        # A failed save is reported, and the next one tries again
+        if data is not None:
+            try:
+                write_save(self.save_file, data)
+            except OSError as error:
+                print("The game could not be saved: {}".format(error))
+
+    # Finish writing the last save and stop the thread
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        self.write_pending()
@@ -0,0 +1,237 @@
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import *
+from messages import achievement_messages
+from big_number import BigNumber, get_suffix
+from engine import GameState
+
+
+'''
+This is a file containing the purchase strategy simulator, used for balancing the game.
+It plays whole games with the real prices and rates from the GameState, but instead of stepping
+frame by frame, it jumps straight to the next time something happens: the next purchase becomes
+affordable, an upgrade or item is shown, or an achievement is reached. A game to 1e18 lbs takes a few
+thousand jumps, so each strategy finishes in a fraction of a second.
+
+The simulated player sells their cleared pollution the moment they clear it, and clicks the earth
+a steady number of times a second. The strategies are run in parallel, one process each.
+
+Usage:
+    python simulator.py                                          # Every strategy
+    python simulator.py best_payback --clicks-per-second 10      # One strategy, clicking faster
+'''
+
+
+# ----------------- Strategies -----------------
+# A strategy picks the next purchase out of the options, which are (cost, added rate, kind, index) tuples.
+# The kind is "item" or "upgrade", and the index is the item type or the position in UPGRADE_ORDER.
+# There is always at least one item to choose from
+
+# Buy whatever costs the least
+def cheapest_first(simulation, options):
+    return min(options)
+
+
+# Buy whatever pays for itself soonest, counting the wait until it can be afforded
+def best_payback(simulation, options):
+    money = float(simulation.state.money)
+    income = simulation.get_income()
+
+    def payback_time(option):
+        cost, added_rate = option[0], option[1]
+        if added_rate == 0:
+            return math.inf
+        return max(0, cost - money) / income + cost / added_rate
+
+    return min(options, key=payback_time)
+
+
+# Save up for the cheapest shown upgrade that adds to the rate, and only buy items while there is none
+def upgrades_first(simulation, options):
+    upgrades = [option for option in options if option[2] == "upgrade" and option[1] > 0]
+    return min(upgrades or [option for option in options if option[2] == "item"])
+
+
+STRATEGIES = {
+    "cheapest_first": cheapest_first,
+    "best_payback": best_payback,
+    "upgrades_first": upgrades_first,
+}
+
+
+# ----------------- The Simulation -----------------
+# One game played by a strategy until the total pollution cleared reaches the target
+class Simulation:
+    def __init__(self, strategy, clicks_per_second=5, target=1e18):
+        self.strategy = strategy
+        self.clicks_per_second = clicks_per_second
+        self.target = BigNumber(target)
+
+        self.state = GameState()
+        self.time = 0  # Seconds of game time
+        self.purchases = 0
+
+        # Items are shown one after another, like on the item panel
+        self.items_shown = 1
+
+        # The cost of the next of each item. Once prices are past 2 ** 53 they are rounded,
+        # so these are worked out the same way buy_item does, and only change when an item is bought
+        self.item_costs = [self.state.get_bulk_price(item_type, 1)[1] for item_type in range(NUM_ITEMS)]
+
+        # The seconds it took to reach each achievement stage, indexed by stage
+        self.achievement_times = [0]
+
+    # The pollution cleared per second, and so the money earned per second
+    def get_income(self):
+        return self.state.get_rate() + self.clicks_per_second * self.state.click_strength
+
+    # Everything that can be bought right now or later, as (cost, added rate, kind, index)
+    def get_options(self):
+        state = self.state
+        options = []
+
+        for item_type in range(self.items_shown):
+            options.append((self.item_costs[item_type], ITEM_RATES[item_type] * state.item_multipliers[item_type],
+                            "item", item_type))
+
+        for upgrade_order in state.upgrades_shown:
+            upgrade = UPGRADE_ORDER[upgrade_order]
+            upgrade_rate = UPGRADE_RATES[upgrade[0]][upgrade[1]]
+            added_rate = sum(state.item_counts[item_type] * ITEM_RATES[item_type] * upgrade_rate
+                             for item_type in UPGRADE_ACTIONS[upgrade[0]])
+            options.append((UPGRADE_ORDER_COSTS[upgrade_order], added_rate, "upgrade", upgrade_order))
+
+        return options
+
+    # The money at which the next upgrade or item is shown, or None if everything is shown
+    def get_next_unlock(self):
+        unlocks = []
+        if self.state.upgrade_count < len(UPGRADE_ORDER) - 1:
+            unlocks.append(UPGRADE_ORDER_COSTS[self.state.upgrade_count])
+        if self.items_shown < NUM_ITEMS:
+            unlocks.append(ITEM_PRICES[self.items_shown - 1])
+
+        return min(unlocks) if unlocks else None
+
+    def update_unlocks(self):
+        self.state.update_upgrades()
+        while self.items_shown < NUM_ITEMS and self.state.money >= ITEM_PRICES[self.items_shown - 1]:
+            self.items_shown += 1
+
+    # Move the game forward by some seconds, all at once, and sell what was cleared
+    def advance(self, seconds):
+        state = self.state
+        income = self.get_income()
+        gain = BigNumber(income * seconds)
+        final_total = state.total_pollution_cleared + gain
+
+        # Work out when each achievement stage in between was reached
+        stage = len(self.achievement_times)
+        while stage < len(achievement_messages) and 1000 ** stage <= final_total:
+            self.achievement_times.append(self.time + float(1000 ** stage - state.total_pollution_cleared) / income)
+            stage += 1
+
+        state.pollution_cleared += gain
+        state.total_pollution_cleared = final_total
+        state.sell()
+
+        self.time += seconds
+        self.update_unlocks()
+
+    def buy(self, option):
+        if option[2] == "item":
+            bought = self.state.buy_item(option[3])
+            self.item_costs[option[3]] = self.state.get_bulk_price(option[3], 1)[1]
+        else:
+            bought = self.state.buy_upgrade(option[3])
+
+        if bought:
+            self.purchases += 1
+
+        return bought
+
+    # Play until the target is reached, jumping from one event to the next
+    def run(self):
+        while self.state.total_pollution_cleared < self.target:
+            option = self.strategy(self, self.get_options())
+            if self.state.money >= option[0] and self.buy(option):
+                continue
+
+            # Wait until the purchase can be afforded, or something new is shown and the strategy might change its mind.
+            # Nothing happens faster than a simulation step, which also keeps rounding from stalling the wait
+            money = self.state.money
+            next_money = option[0]
+            next_unlock = self.get_next_unlock()
+            if next_unlock is not None and money < next_unlock < next_money:
+                next_money = next_unlock
+
+            income = self.get_income()
+            seconds = min(float(next_money - money), float(self.target - self.state.total_pollution_cleared)) / income
+            self.advance(max(seconds, SIMULATION_STEP))
+
+        return self
+
+
+# Plays a game with the named strategy, and returns the simulation and the seconds it took to run
+def run_strategy(name, clicks_per_second, target):
+    start = time.perf_counter()
+    simulation = Simulation(STRATEGIES[name], clicks_per_second, target).run()
+
+    return name, simulation, time.perf_counter() - start
+
+
+# ----------------- Reporting -----------------
+# Seconds of game time, like 2d 03:04:05
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+
+    duration = "{:02}:{:02}:{:02}".format(hours, minutes, seconds)
+    return "{}d {}".format(days, duration) if days else duration
+
+
+def print_results(results):
+    print("{:>14}".format("") + "".join("{:>18}".format(name) for name, _, _ in results))
+
+    for stage in range(1, len(achievement_messages)):
+        row = "{:>14}".format("1" + get_suffix(stage) + " lbs")
+        for _, simulation, _ in results:
+            times = simulation.achievement_times
+            row += "{:>18}".format(format_duration(times[stage]) if stage < len(times) else "-")
+        print(row)
+
+    print("{:>14}".format("purchases") + "".join("{:>18}".format(simulation.purchases)
+                                                 for _, simulation, _ in results))
+    print("{:>14}".format("simulated in") + "".join("{:>15.1f} ms".format(seconds * 1000)
+                                                    for _, _, seconds in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates whole games to compare purchase strategies.")
+    parser.add_argument("strategies", nargs="*", help="the strategies to run, or all of them: " + ", ".join(STRATEGIES))
+    parser.add_argument("--target", type=float, default=1e18, help="the total pounds of pollution to clear")
+    parser.add_argument("--clicks-per-second", type=float, default=5, help="how fast the player clicks the earth")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to run the strategies in")
+    args = parser.parse_args()
+
+    for name in args.strategies:
+        if name not in STRATEGIES:
+            parser.error("unknown strategy: " + name)
+    if args.clicks_per_second <= 0:
+        parser.error("the player has to click to buy the first item")
+
+    names = args.strategies or list(STRATEGIES)
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(names))) as executor:
+        results = list(executor.map(run_strategy, names, [args.clicks_per_second] * len(names),
+                                    [args.target] * len(names)))
+
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
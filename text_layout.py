@@ -0,0 +1,78 @@
+import pygame
+from cache import LRUCache
+
+
+'''
+This is a file containing the text layout engine, used for text that wraps onto several lines.
+Lines are broken using the real widths of the font's glyphs, and the finished block of text
+is rendered onto one surface that is kept, so wrapped text is only laid out and rendered once.
+'''
+
+
+# ----------------- Line Breaking -----------------
+# Splits text into lines that are no wider than width when rendered with the font.
+# A word that is wider than the width by itself gets a line of its own
+def wrap_text(font, text, width):
+    lines = []
+    current_line = ""
+
+    for word in text.split():
+        next_line = current_line + " " + word if current_line else word
+        if current_line and font.size(next_line)[0] > width:
+            lines.append(current_line)
+            next_line = word
+
+        current_line = next_line
+
+    if current_line:
+        lines.append(current_line)
+
+    return lines
+
+
+# ----------------- The Text Layout Cache -----------------
+# (extends LRUCache)
+# Remembers the rendered surface of every block of wrapped text.
+# Layouts are keyed by (font, text, width, height, color, highlight color)
+class TextLayoutCache(LRUCache):
+    def __init__(self, max_layouts=128):
+        super().__init__(max_layouts)
+
+    # Returns a surface with the text wrapped to width, and its lines spread evenly over height.
+    # With a highlight color, the first line up to and including its first ":" is drawn in that color.
+    # Returns None if there is no text
+    def render(self, font, text, width, height, color, highlight_color=None):
+        return self.get((font, text, width, height, color, highlight_color), self.render_layout,
+                        font, text, width, height, color, highlight_color)
+
+    def render_layout(self, font, text, width, height, color, highlight_color):
+        lines = wrap_text(font, text, width)
+        if not lines:
+            return None
+
+        # Each piece of text and where it goes
+        blits = []
+        for i in range(len(lines)):
+            y = i * height // len(lines)
+            line = lines[i]
+
+            if i == 0 and highlight_color is not None and ":" in line:
+                name = line[:line.index(":") + 1]
+                blits.append((font.render(name, True, highlight_color), (0, y)))
+                line = line[len(name):]
+                blits.append((font.render(line, True, color), (font.size(name)[0], y)))
+            else:
+                blits.append((font.render(line, True, color), (0, y)))
+
+        area = blits[0][0].get_rect().unionall([text_surf.get_rect(topleft=position) for text_surf, position in blits])
+        layout = pygame.Surface(area.size, pygame.SRCALPHA)
+
+        # The pieces never overlap, so taking the maximum keeps each glyph's own color and alpha
+        for text_surf, position in blits:
+            layout.blit(text_surf, position, special_flags=pygame.BLEND_RGBA_MAX)
+
+        return layout
+
+
+# The shared layout cache used by every object with wrapped text
+text_layouts = TextLayoutCache()